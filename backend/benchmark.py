@@ -0,0 +1,173 @@
+"""Latency benchmarks for hot API paths.
+
+Runs against a scratch database (``<DB_NAME>_bench``) on the configured
+MongoDB server, so it never touches production data.
+
+    python benchmark.py dashboard --sizes 10000 --sizes 100000
+    python benchmark.py search --sizes 100000 --output benchmark-results.jsonl
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+
+import server
+
+cli = typer.Typer(help="Haergo HR latency benchmarks")
+
+BENCH_USER = {'id': 'bench', 'email': 'bench@haergo.com', 'role': 'super_admin', 'employee_id': None}
+STATUSES = ['aktif'] * 8 + ['non-aktif', 'cuti', 'resign']
+
+def bench_db():
+    return server.client[f"{server.db.name}_bench"]
+
+async def seed_org(db, employees: int, departments: int = 20, positions_per_dept: int = 5):
+    """Reset the scratch database and fill it with a synthetic organisation"""
+    await db.departments.delete_many({})
+    await db.positions.delete_many({})
+    await db.employees.delete_many({})
+
+    now = datetime.now(timezone.utc)
+    dept_ids = [str(uuid.uuid4()) for _ in range(departments)]
+    await db.departments.insert_many([
+        {'id': d, 'nama': f'Departemen {i}', 'kode': f'D{i:03d}', 'deskripsi': None, 'created_at': now.isoformat()}
+        for i, d in enumerate(dept_ids)
+    ])
+
+    positions = []
+    for d in dept_ids:
+        for level in range(1, positions_per_dept + 1):
+            positions.append({
+                'id': str(uuid.uuid4()), 'nama': f'Posisi {level}', 'level': level,
+                'department_id': d, 'deskripsi': None, 'created_at': now.isoformat()
+            })
+    await db.positions.insert_many(positions)
+
+    batch = []
+    for i in range(employees):
+        pos = random.choice(positions)
+        joined = now - timedelta(days=random.randint(0, 3650))
+        doc = {
+            'id': str(uuid.uuid4()),
+            'nik': f'B{i:07d}',
+            'nama_lengkap': f'Karyawan {i}',
+            'email': f'karyawan{i}@bench.haergo.com',
+            'tanggal_bergabung': joined.strftime('%Y-%m-%d'),
+            'department_id': pos['department_id'],
+            'position_id': pos['id'],
+            'status': random.choice(STATUSES),
+            'user_id': None,
+            'created_at': joined.isoformat()
+        }
+        doc['search_terms'] = server.employee_search_terms(doc)
+        batch.append(doc)
+        if len(batch) == 5000:
+            await db.employees.insert_many(batch)
+            batch = []
+    if batch:
+        await db.employees.insert_many(batch)
+
+async def legacy_dashboard_stats(db):
+    """The pre-aggregation implementation: one count per metric, department and status"""
+    await db.employees.count_documents({})
+    await db.employees.count_documents({'status': 'aktif'})
+    await db.employees.count_documents({'status': {'$ne': 'aktif'}})
+    await db.departments.count_documents({})
+    await db.positions.count_documents({})
+    for dept in await db.departments.find({}, {'_id': 0}).to_list(100):
+        await db.employees.count_documents({'department_id': dept['id'], 'status': 'aktif'})
+    for s in ['aktif', 'non-aktif', 'cuti', 'resign']:
+        await db.employees.count_documents({'status': s})
+    first_day = datetime.now(timezone.utc).strftime('%Y-%m-01')
+    await db.employees.count_documents({'tanggal_bergabung': {'$gte': first_day}})
+
+async def measure(func, runs: int) -> dict:
+    await func()  # warm-up
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[max(0, int(len(samples) * 0.95) - 1)], 2)
+    }
+
+def report(title: str, rows: List[tuple]):
+    typer.echo(f"\n{title}")
+    typer.echo(f"{'employees':>10} {'variant':<20} {'median_ms':>10} {'p95_ms':>10}")
+    for size, variant, result in rows:
+        typer.echo(f"{size:>10} {variant:<20} {result['median_ms']:>10} {result['p95_ms']:>10}")
+
+async def run_dashboard(db, sizes: List[int], runs: int) -> List[tuple]:
+    server.db = db
+    rows = []
+    for size in sizes:
+        typer.echo(f"Seeding {size} employees...")
+        await seed_org(db, size)
+        await server.rebuild_employee_stats()
+        rows.append((size, 'legacy', await measure(lambda: legacy_dashboard_stats(db), runs)))
+        rows.append((size, 'facet', await measure(server.rebuild_employee_stats, runs)))
+        rows.append((size, 'materialized', await measure(lambda: server.get_dashboard_stats(user=BENCH_USER), runs)))
+    return rows
+
+SEARCH_TERMS = ['kar', 'karyawan 4242', 'b00042', 'karyawan4242@bench']
+
+async def run_search(db, sizes: List[int], runs: int) -> List[tuple]:
+    server.db = db
+    rows = []
+    for size in sizes:
+        typer.echo(f"Seeding {size} employees...")
+        await seed_org(db, size)
+        await server.ensure_indexes()
+        for term in SEARCH_TERMS:
+            result = await measure(lambda: server.get_employees(search=term, limit=20, user=BENCH_USER), runs)
+            rows.append((size, term, result))
+    return rows
+
+def save_results(output: Optional[Path], title: str, rows: List[tuple]):
+    """Append one run to a JSON-lines file so results can be compared across deploys"""
+    if output is None:
+        return
+    record = {
+        'benchmark': title,
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'results': [{'employees': size, 'variant': variant, **result} for size, variant, result in rows]
+    }
+    with output.open('a') as f:
+        f.write(json.dumps(record) + '\n')
+
+OUTPUT_OPTION = typer.Option(None, help="Append results as a JSON line to this file")
+
+@cli.command()
+def dashboard(
+    sizes: List[int] = typer.Option([10000, 100000], help="Employee counts to benchmark"),
+    runs: int = typer.Option(20, help="Timed runs per variant"),
+    output: Optional[Path] = OUTPUT_OPTION
+):
+    """Compare the legacy per-count dashboard, the $facet rebuild and the materialized read"""
+    rows = asyncio.run(run_dashboard(bench_db(), sizes, runs))
+    report("GET /dashboard/stats", rows)
+    save_results(output, "GET /dashboard/stats", rows)
+
+@cli.command()
+def search(
+    sizes: List[int] = typer.Option([100000], help="Employee counts to benchmark"),
+    runs: int = typer.Option(50, help="Timed runs per query"),
+    output: Optional[Path] = OUTPUT_OPTION
+):
+    """Measure indexed employee search latency for typical search-box input"""
+    rows = asyncio.run(run_search(bench_db(), sizes, runs))
+    report("GET /employees?search=...&limit=20", rows)
+    save_results(output, "GET /employees?search=...&limit=20", rows)
+
+if __name__ == "__main__":
+    cli()
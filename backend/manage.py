@@ -0,0 +1,104 @@
+"""Maintenance commands for the Haergo HR backend.
+
+    python manage.py rebuild-stats
+    python manage.py backfill-search
+    python manage.py ensure-indexes
+    python manage.py dedupe-attendance
+    python manage.py migrate-photos
+    python manage.py rebuild-attendance-monthly --month 2025-01
+    python manage.py audit-geofence --start 2025-01-01 --end 2025-12-31
+    python manage.py migrate-face-descriptors
+"""
+import asyncio
+
+import typer
+
+import server
+
+cli = typer.Typer(help="Haergo HR maintenance commands")
+
+@cli.command("rebuild-stats")
+def rebuild_stats():
+    """Recompute the materialized dashboard counters from the employees collection"""
+    stats_doc = asyncio.run(server.rebuild_employee_stats())
+    typer.echo(f"Employee stats rebuilt: {stats_doc['total']} employees")
+
+@cli.command("backfill-search")
+def backfill_search():
+    """Populate employees.search_terms for records created before search indexing"""
+    updated = asyncio.run(server.backfill_employee_search_terms())
+    typer.echo(f"Search terms backfilled: {updated} employees")
+
+@cli.command("ensure-indexes")
+def ensure_indexes(
+    background: bool = typer.Option(True, help="Request non-blocking builds (relevant on MongoDB < 4.2)"),
+    dedupe: bool = typer.Option(True, help="Delete duplicate attendance days and photos first so the unique indexes can build")
+):
+    """Build any missing indexes; run this before deploying with INDEX_BUILD_MODE=off"""
+    async def run():
+        if dedupe:
+            deleted = await server.dedupe_attendance()
+            typer.echo(f"Duplicate attendance records deleted: {deleted}")
+            deleted = await server.dedupe_photos()
+            typer.echo(f"Duplicate photo files deleted: {deleted}")
+        built = await server.ensure_indexes(background=background)
+        missing = await server.missing_required_indexes()
+        return built, missing
+
+    built, missing = asyncio.run(run())
+    for name in built:
+        typer.echo(f"Created {name}")
+    typer.echo(f"{len(built)} index(es) built")
+    if missing:
+        typer.echo(f"Required index(es) still missing: {', '.join(missing)}", err=True)
+        raise typer.Exit(code=1)
+
+@cli.command("dedupe-attendance")
+def dedupe_attendance():
+    """Delete duplicate (employee_id, tanggal) attendance records, keeping the most complete one"""
+    deleted = asyncio.run(server.dedupe_attendance())
+    typer.echo(f"Duplicate attendance records deleted: {deleted}")
+
+@cli.command("migrate-photos")
+def migrate_photos():
+    """Move inline base64 attendance selfies into the photo store"""
+    migrated = asyncio.run(server.migrate_attendance_photos())
+    typer.echo(f"Photos migrated: {migrated} attendance records")
+
+def validate_month(month: str) -> str:
+    if month is not None and not server.is_valid_month(month):
+        raise typer.BadParameter("expected YYYY-MM, e.g. 2025-01")
+    return month
+
+@cli.command("rebuild-attendance-monthly")
+def rebuild_attendance_monthly(
+    month: str = typer.Option(None, callback=validate_month, help="Only rebuild this month (YYYY-MM); default all months")
+):
+    """Recompute the attendance_monthly rollups from the attendance collection"""
+    rollups = asyncio.run(server.rebuild_attendance_monthly(month))
+    typer.echo(f"Attendance monthly rollups rebuilt: {rollups} documents")
+
+@cli.command("audit-geofence")
+def audit_geofence(
+    start: str = typer.Option(None, help="First attendance date (YYYY-MM-DD)"),
+    end: str = typer.Option(None, help="Last attendance date (YYYY-MM-DD)"),
+    chunk_size: int = typer.Option(server.GEOFENCE_AUDIT_CHUNK_SIZE, help="Attendance records per NumPy batch")
+):
+    """Flag historical WFO clock-ins that fall outside every office radius"""
+    result = asyncio.run(server.audit_geofence(start, end, chunk_size=chunk_size, max_flagged=None))
+    for row in result['di_luar_radius']:
+        typer.echo(f"{row['tanggal']}\t{row['id']}\t{row['employee_id']}\t{row['kantor_terdekat']}\t{row['jarak']}m")
+    typer.echo(
+        f"{result['total_diperiksa']} clock-ins checked against {result['jumlah_kantor']} offices: "
+        f"{result['total_di_luar_radius']} out of radius, "
+        f"{result['durasi_detik']}s ({result['record_per_detik']} records/s)"
+    )
+
+@cli.command("migrate-face-descriptors")
+def migrate_face_descriptors():
+    """Move legacy face_data descriptors into the face_templates array (packed float32)"""
+    migrated = asyncio.run(server.migrate_face_descriptors())
+    typer.echo(f"Face descriptors migrated: {migrated} records")
+
+if __name__ == "__main__":
+    cli()
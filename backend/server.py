@@ -1,17 +1,34 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, UploadFile, File, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from gridfs.errors import FileExists, NoFile
 import os
+import json
+import base64
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union
+import re
 import uuid
+import hashlib
+import binascii
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
+from thumbnails import THUMBNAIL_ERRORS, make_thumbnail
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,6 +43,27 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'haergo-secret-key-2024')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
+# Authenticated user cache (per worker process)
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '5000'))
+
+# Password hashing executor (bcrypt releases the GIL, so threads run in parallel)
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_MAX_CONCURRENCY', str(PASSWORD_HASH_WORKERS)))
+
+# Keyset pagination
+EMPLOYEE_PAGE_SIZE = 50
+EMPLOYEE_PAGE_MAX_SIZE = 200
+EMPLOYEE_LIST_MAX_SIZE = 1000  # unpaginated GET /employees
+ATTENDANCE_PAGE_SIZE = 100
+ATTENDANCE_PAGE_MAX_SIZE = 500
+
+# Attendance photo store (GridFS bucket, content-addressed by SHA-256)
+PHOTO_BUCKET = 'photos'
+PHOTO_MAX_BYTES = int(os.environ.get('PHOTO_MAX_BYTES', str(2 * 1024 * 1024)))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '160'))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+
 # Security
 security = HTTPBearer()
 
@@ -129,6 +167,10 @@ class EmployeeResponse(EmployeeBase):
     position_nama: Optional[str] = None
     user_id: Optional[str] = None
 
+class EmployeePageResponse(BaseModel):
+    items: List[EmployeeResponse]
+    next_cursor: Optional[str] = None
+
 class DashboardStats(BaseModel):
     total_karyawan: int
     karyawan_aktif: int
@@ -139,6 +181,86 @@ class DashboardStats(BaseModel):
     karyawan_per_status: List[dict]
     karyawan_baru_bulan_ini: int
 
+# ===================== CACHE =====================
+
+class TTLCache:
+    """Bounded in-process LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# Keyed by user id. Each worker holds its own copy, so writes handled by another
+# worker are only picked up once the entry expires (USER_CACHE_TTL_SECONDS).
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# ===================== PAGINATION =====================
+
+def encode_cursor(values: list) -> str:
+    """Encode the sort-key values of the last returned row as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, types: tuple) -> list:
+    """Decode a cursor whose values must have exactly the given types, e.g. (str, str)
+
+    Values go straight into $gt/$lt filters, so anything else (notably an
+    object such as {"$ne": null}) is rejected rather than passed to MongoDB.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    if not all(type(value) is expected for value, expected in zip(values, types)):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    return values
+
 # ===================== AUTH HELPERS =====================
 
 def hash_password(password: str) -> str:
@@ -147,6 +269,57 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password')
+password_semaphore = asyncio.Semaphore(PASSWORD_HASH_MAX_CONCURRENCY)
+password_stats = {
+    'waiting': 0,
+    'max_waiting': 0,
+    'in_flight': 0,
+    'completed': 0,
+    'total_wait_ms': 0.0,
+    'total_run_ms': 0.0
+}
+
+async def run_password_task(func, *args):
+    """Run a bcrypt call on the password executor without blocking the event loop"""
+    queued_at = time.perf_counter()
+    password_stats['waiting'] += 1
+    password_stats['max_waiting'] = max(password_stats['max_waiting'], password_stats['waiting'])
+    try:
+        await password_semaphore.acquire()
+    finally:
+        password_stats['waiting'] -= 1
+    started_at = time.perf_counter()
+    password_stats['in_flight'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, func, *args)
+    finally:
+        password_semaphore.release()
+        password_stats['in_flight'] -= 1
+        password_stats['completed'] += 1
+        password_stats['total_wait_ms'] += (started_at - queued_at) * 1000
+        password_stats['total_run_ms'] += (time.perf_counter() - started_at) * 1000
+
+async def hash_password_async(password: str) -> str:
+    return await run_password_task(hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await run_password_task(verify_password, password, hashed)
+
+def password_executor_stats() -> dict:
+    completed = password_stats['completed']
+    return {
+        'workers': PASSWORD_HASH_WORKERS,
+        'max_concurrency': PASSWORD_HASH_MAX_CONCURRENCY,
+        'waiting': password_stats['waiting'],
+        'max_waiting': password_stats['max_waiting'],
+        'in_flight': password_stats['in_flight'],
+        'completed': completed,
+        'avg_wait_ms': round(password_stats['total_wait_ms'] / completed, 2) if completed else 0.0,
+        'avg_run_ms': round(password_stats['total_run_ms'] / completed, 2) if completed else 0.0
+    }
+
 def create_token(user_id: str, email: str, role: str) -> str:
     payload = {
         'user_id': user_id,
@@ -159,10 +332,13 @@ def create_token(user_id: str, email: str, role: str) -> str:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({'id': payload['user_id']}, {'_id': 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User tidak ditemukan")
-        return user
+        user = user_cache.get(payload['user_id'])
+        if user is None:
+            user = await db.users.find_one({'id': payload['user_id']}, {'_id': 0, 'password': 0})
+            if not user:
+                raise HTTPException(status_code=401, detail="User tidak ditemukan")
+            user_cache.set(payload['user_id'], user)
+        return dict(user)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token sudah kadaluarsa")
     except jwt.InvalidTokenError:
@@ -188,12 +364,16 @@ async def register(user_data: UserCreate):
         'id': user_id,
         'email': user_data.email,
         'nama_lengkap': user_data.nama_lengkap,
-        'password': hash_password(user_data.password),
+        'password': await hash_password_async(user_data.password),
         'role': user_data.role,
         'employee_id': None,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent registration with the same email won the unique index
+        raise HTTPException(status_code=400, detail="Email sudah terdaftar")
     
     return UserResponse(
         id=user_id,
@@ -207,7 +387,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({'email': credentials.email}, {'_id': 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await verify_password_async(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Email atau password salah")
     
     token = create_token(user['id'], user['email'], user['role'])
@@ -237,6 +417,29 @@ async def get_me(user: dict = Depends(get_current_user)):
 
 # ===================== DEPARTMENT ROUTES =====================
 
+async def count_active_employees_by_department(dept_ids: Optional[List[str]] = None) -> dict:
+    """Count active employees per department in a single aggregation"""
+    match = {'status': 'aktif'}
+    if dept_ids is not None:
+        match['department_id'] = {'$in': dept_ids}
+    
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': '$department_id', 'count': {'$sum': 1}}}
+    ]
+    rows = await db.employees.aggregate(pipeline).to_list(None)
+    return {row['_id']: row['count'] for row in rows}
+
+def build_department_response(dept: dict, count: int) -> DepartmentResponse:
+    return DepartmentResponse(
+        id=dept['id'],
+        nama=dept['nama'],
+        deskripsi=dept.get('deskripsi'),
+        kode=dept['kode'],
+        created_at=dept['created_at'],
+        jumlah_karyawan=count
+    )
+
 @api_router.post("/departments", response_model=DepartmentResponse)
 async def create_department(
     data: DepartmentCreate,
@@ -254,7 +457,10 @@ async def create_department(
         'kode': data.kode,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
-    await db.departments.insert_one(dept_doc)
+    try:
+        await db.departments.insert_one(dept_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Kode departemen sudah ada")
     
     return DepartmentResponse(
         id=dept_id,
@@ -267,20 +473,9 @@ async def create_department(
 
 @api_router.get("/departments", response_model=List[DepartmentResponse])
 async def get_departments(user: dict = Depends(get_current_user)):
-    departments = await db.departments.find({}, {'_id': 0}).to_list(100)
-    
-    result = []
-    for dept in departments:
-        count = await db.employees.count_documents({'department_id': dept['id'], 'status': 'aktif'})
-        result.append(DepartmentResponse(
-            id=dept['id'],
-            nama=dept['nama'],
-            deskripsi=dept.get('deskripsi'),
-            kode=dept['kode'],
-            created_at=dept['created_at'],
-            jumlah_karyawan=count
-        ))
-    return result
+    departments = await db.departments.find({}, {'_id': 0}).to_list(None)
+    counts = await count_active_employees_by_department()
+    return [build_department_response(dept, counts.get(dept['id'], 0)) for dept in departments]
 
 @api_router.get("/departments/{dept_id}", response_model=DepartmentResponse)
 async def get_department(dept_id: str, user: dict = Depends(get_current_user)):
@@ -288,15 +483,8 @@ async def get_department(dept_id: str, user: dict = Depends(get_current_user)):
     if not dept:
         raise HTTPException(status_code=404, detail="Departemen tidak ditemukan")
     
-    count = await db.employees.count_documents({'department_id': dept_id, 'status': 'aktif'})
-    return DepartmentResponse(
-        id=dept['id'],
-        nama=dept['nama'],
-        deskripsi=dept.get('deskripsi'),
-        kode=dept['kode'],
-        created_at=dept['created_at'],
-        jumlah_karyawan=count
-    )
+    counts = await count_active_employees_by_department([dept_id])
+    return build_department_response(dept, counts.get(dept_id, 0))
 
 @api_router.put("/departments/{dept_id}", response_model=DepartmentResponse)
 async def update_department(
@@ -308,22 +496,17 @@ async def update_department(
     if not dept:
         raise HTTPException(status_code=404, detail="Departemen tidak ditemukan")
     
-    await db.departments.update_one(
-        {'id': dept_id},
-        {'$set': {'nama': data.nama, 'deskripsi': data.deskripsi, 'kode': data.kode}}
-    )
+    try:
+        await db.departments.update_one(
+            {'id': dept_id},
+            {'$set': {'nama': data.nama, 'deskripsi': data.deskripsi, 'kode': data.kode}}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Kode departemen sudah ada")
     
     updated = await db.departments.find_one({'id': dept_id}, {'_id': 0})
-    count = await db.employees.count_documents({'department_id': dept_id, 'status': 'aktif'})
-    
-    return DepartmentResponse(
-        id=updated['id'],
-        nama=updated['nama'],
-        deskripsi=updated.get('deskripsi'),
-        kode=updated['kode'],
-        created_at=updated['created_at'],
-        jumlah_karyawan=count
-    )
+    counts = await count_active_employees_by_department([dept_id])
+    return build_department_response(updated, counts.get(dept_id, 0))
 
 @api_router.delete("/departments/{dept_id}")
 async def delete_department(
@@ -468,6 +651,43 @@ async def delete_position(
 
 # ===================== EMPLOYEE ROUTES =====================
 
+async def fetch_names(collection, ids, field: str = 'nama') -> dict:
+    """Resolve `id -> name field` for many documents with one $in query"""
+    ids = list({i for i in ids if i})
+    if not ids:
+        return {}
+    docs = await collection.find({'id': {'$in': ids}}, {'_id': 0, 'id': 1, field: 1}).to_list(None)
+    return {d['id']: d.get(field) for d in docs}
+
+def build_employee_response(emp: dict, dept_names: dict, pos_names: dict) -> EmployeeResponse:
+    return EmployeeResponse(
+        id=emp['id'],
+        nik=emp['nik'],
+        nama_lengkap=emp['nama_lengkap'],
+        email=emp['email'],
+        telepon=emp.get('telepon'),
+        alamat=emp.get('alamat'),
+        tanggal_lahir=emp.get('tanggal_lahir'),
+        jenis_kelamin=emp.get('jenis_kelamin'),
+        tanggal_bergabung=emp['tanggal_bergabung'],
+        department_id=emp['department_id'],
+        position_id=emp['position_id'],
+        status=emp['status'],
+        foto_url=emp.get('foto_url'),
+        created_at=emp['created_at'],
+        department_nama=dept_names.get(emp['department_id']),
+        position_nama=pos_names.get(emp['position_id']),
+        user_id=emp.get('user_id')
+    )
+
+async def build_employee_responses(employees: List[dict]) -> List[EmployeeResponse]:
+    """Build responses with department/position names fetched in one query per collection"""
+    dept_names, pos_names = await asyncio.gather(
+        fetch_names(db.departments, (e['department_id'] for e in employees)),
+        fetch_names(db.positions, (e['position_id'] for e in employees))
+    )
+    return [build_employee_response(emp, dept_names, pos_names) for emp in employees]
+
 @api_router.post("/employees", response_model=EmployeeResponse)
 async def create_employee(
     data: EmployeeCreate,
@@ -503,7 +723,12 @@ async def create_employee(
         'user_id': None,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
-    await db.employees.insert_one(emp_doc)
+    emp_doc['search_terms'] = employee_search_terms(emp_doc)
+    try:
+        await db.employees.insert_one(emp_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="NIK atau Email sudah terdaftar")
+    await apply_employee_stats(None, emp_doc)
     
     return EmployeeResponse(
         id=emp_id,
@@ -525,51 +750,113 @@ async def create_employee(
         user_id=None
     )
 
-@api_router.get("/employees", response_model=List[EmployeeResponse])
+def normalize_search_text(text) -> str:
+    """Lowercase and strip accents so 'Sánchez' and 'sanchez' index identically"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return text.encode('ascii', 'ignore').decode('ascii').lower()
+
+def tokenize_search_text(text) -> List[str]:
+    return [t for t in re.split(r'[^0-9a-z]+', normalize_search_text(text)) if t]
+
+def employee_search_terms(emp: dict) -> List[str]:
+    """Build the indexed `search_terms` array (word tokens plus whole NIK/email)"""
+    terms = set()
+    for field in ('nama_lengkap', 'nik', 'email'):
+        terms.update(tokenize_search_text(emp.get(field)))
+    for field in ('nik', 'email'):
+        if emp.get(field):
+            terms.add(normalize_search_text(emp[field]))
+    return sorted(terms)
+
+def employee_match_score(tokens: List[str], whole_query: str) -> dict:
+    """Aggregation expression for search relevance: 3 per token that is a whole
+    term (1 for a prefix-only match) plus 10 for an exact NIK or email"""
+    return {'$add': [
+        *({'$cond': [{'$in': [token, '$search_terms']}, 3, 1]} for token in tokens),
+        {'$cond': [{'$in': [whole_query, [{'$toLower': '$nik'}, {'$toLower': '$email'}]]}, 10, 0]}
+    ]}
+
+async def search_employees(query: dict, search: str, limit: int) -> List[dict]:
+    """Prefix-match every search token against the indexed `search_terms` array"""
+    tokens = tokenize_search_text(search)
+    if not tokens:
+        return []
+    
+    # Anchored, case-sensitive prefixes of escaped input use the index as a range scan
+    query = dict(query)
+    query['$and'] = [{'search_terms': {'$regex': f'^{re.escape(token)}'}} for token in tokens]
+    whole_query = normalize_search_text(search).strip()
+    # Every match is scored server-side; $sort followed by $limit keeps only the top N
+    return await db.employees.aggregate([
+        {'$match': query},
+        {'$addFields': {'_score': employee_match_score(tokens, whole_query)}},
+        {'$sort': {'_score': -1, 'nama_lengkap': 1}},
+        {'$limit': limit},
+        {'$project': {'_id': 0, '_score': 0}}
+    ]).to_list(limit)
+
+async def backfill_employee_search_terms() -> int:
+    """Populate `search_terms` on employees written before search indexing existed"""
+    updated = 0
+    cursor = db.employees.find({'search_terms': {'$exists': False}}, {'_id': 0, 'id': 1, 'nama_lengkap': 1, 'nik': 1, 'email': 1})
+    async for emp in cursor:
+        # Skip employees whose terms an update_employee wrote meanwhile
+        result = await db.employees.update_one(
+            {'id': emp['id'], 'search_terms': {'$exists': False}},
+            {'$set': {'search_terms': employee_search_terms(emp)}}
+        )
+        updated += result.modified_count
+    return updated
+
+@api_router.get("/employees", response_model=Union[EmployeePageResponse, List[EmployeeResponse]])
 async def get_employees(
     department_id: Optional[str] = None,
     status: Optional[str] = None,
     search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=EMPLOYEE_PAGE_MAX_SIZE),
+    after: Optional[str] = None,
+    response: Response = None,
     user: dict = Depends(get_current_user)
 ):
+    """List employees; passing `limit` or `after` switches to keyset pages ordered by NIK"""
     query = {}
     if department_id:
         query['department_id'] = department_id
     if status:
         query['status'] = status
-    if search:
-        query['$or'] = [
-            {'nama_lengkap': {'$regex': search, '$options': 'i'}},
-            {'nik': {'$regex': search, '$options': 'i'}},
-            {'email': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    employees = await db.employees.find(query, {'_id': 0}).to_list(1000)
     
-    result = []
-    for emp in employees:
-        dept = await db.departments.find_one({'id': emp['department_id']}, {'_id': 0})
-        pos = await db.positions.find_one({'id': emp['position_id']}, {'_id': 0})
-        result.append(EmployeeResponse(
-            id=emp['id'],
-            nik=emp['nik'],
-            nama_lengkap=emp['nama_lengkap'],
-            email=emp['email'],
-            telepon=emp.get('telepon'),
-            alamat=emp.get('alamat'),
-            tanggal_lahir=emp.get('tanggal_lahir'),
-            jenis_kelamin=emp.get('jenis_kelamin'),
-            tanggal_bergabung=emp['tanggal_bergabung'],
-            department_id=emp['department_id'],
-            position_id=emp['position_id'],
-            status=emp['status'],
-            foto_url=emp.get('foto_url'),
-            created_at=emp['created_at'],
-            department_nama=dept['nama'] if dept else None,
-            position_nama=pos['nama'] if pos else None,
-            user_id=emp.get('user_id')
-        ))
-    return result
+    if search:
+        # Ranked top matches; search results are not paginated
+        employees = await search_employees(query, search, limit or EMPLOYEE_LIST_MAX_SIZE)
+        items = await build_employee_responses(employees)
+        if limit is None and after is None:
+            return items
+        return EmployeePageResponse(items=items, next_cursor=None)
+    
+    if limit is None and after is None:
+        # Unpaginated callers get the first EMPLOYEE_LIST_MAX_SIZE by NIK; when
+        # more exist, X-Next-Cursor says so and continues as `after`
+        employees = await db.employees.find(query, {'_id': 0}).sort('nik', 1).to_list(EMPLOYEE_LIST_MAX_SIZE + 1)
+        if len(employees) > EMPLOYEE_LIST_MAX_SIZE:
+            employees = employees[:EMPLOYEE_LIST_MAX_SIZE]
+            if response is not None:
+                response.headers['X-Next-Cursor'] = encode_cursor([employees[-1]['nik']])
+        return await build_employee_responses(employees)
+    
+    page_size = limit or EMPLOYEE_PAGE_SIZE
+    if after:
+        after_nik, = decode_cursor(after, (str,))
+        query['nik'] = {'$gt': after_nik}
+    
+    # Fetch one extra row to learn whether another page exists
+    employees = await db.employees.find(query, {'_id': 0}).sort('nik', 1).limit(page_size + 1).to_list(page_size + 1)
+    has_more = len(employees) > page_size
+    employees = employees[:page_size]
+    
+    return EmployeePageResponse(
+        items=await build_employee_responses(employees),
+        next_cursor=encode_cursor([employees[-1]['nik']]) if has_more else None
+    )
 
 @api_router.get("/employees/{emp_id}", response_model=EmployeeResponse)
 async def get_employee(emp_id: str, user: dict = Depends(get_current_user)):
@@ -577,28 +864,7 @@ async def get_employee(emp_id: str, user: dict = Depends(get_current_user)):
     if not emp:
         raise HTTPException(status_code=404, detail="Karyawan tidak ditemukan")
     
-    dept = await db.departments.find_one({'id': emp['department_id']}, {'_id': 0})
-    pos = await db.positions.find_one({'id': emp['position_id']}, {'_id': 0})
-    
-    return EmployeeResponse(
-        id=emp['id'],
-        nik=emp['nik'],
-        nama_lengkap=emp['nama_lengkap'],
-        email=emp['email'],
-        telepon=emp.get('telepon'),
-        alamat=emp.get('alamat'),
-        tanggal_lahir=emp.get('tanggal_lahir'),
-        jenis_kelamin=emp.get('jenis_kelamin'),
-        tanggal_bergabung=emp['tanggal_bergabung'],
-        department_id=emp['department_id'],
-        position_id=emp['position_id'],
-        status=emp['status'],
-        foto_url=emp.get('foto_url'),
-        created_at=emp['created_at'],
-        department_nama=dept['nama'] if dept else None,
-        position_nama=pos['nama'] if pos else None,
-        user_id=emp.get('user_id')
-    )
+    return (await build_employee_responses([emp]))[0]
 
 @api_router.put("/employees/{emp_id}", response_model=EmployeeResponse)
 async def update_employee(
@@ -626,32 +892,26 @@ async def update_employee(
         if not pos:
             raise HTTPException(status_code=400, detail="Posisi tidak ditemukan")
     
-    if update_data:
-        await db.employees.update_one({'id': emp_id}, {'$set': update_data})
-    
-    updated = await db.employees.find_one({'id': emp_id}, {'_id': 0})
-    dept = await db.departments.find_one({'id': updated['department_id']}, {'_id': 0})
-    pos = await db.positions.find_one({'id': updated['position_id']}, {'_id': 0})
+    if 'nama_lengkap' in update_data or 'email' in update_data:
+        update_data['search_terms'] = employee_search_terms({**emp, **update_data})
     
-    return EmployeeResponse(
-        id=updated['id'],
-        nik=updated['nik'],
-        nama_lengkap=updated['nama_lengkap'],
-        email=updated['email'],
-        telepon=updated.get('telepon'),
-        alamat=updated.get('alamat'),
-        tanggal_lahir=updated.get('tanggal_lahir'),
-        jenis_kelamin=updated.get('jenis_kelamin'),
-        tanggal_bergabung=updated['tanggal_bergabung'],
-        department_id=updated['department_id'],
-        position_id=updated['position_id'],
-        status=updated['status'],
-        foto_url=updated.get('foto_url'),
-        created_at=updated['created_at'],
-        department_nama=dept['nama'] if dept else None,
-        position_nama=pos['nama'] if pos else None,
-        user_id=updated.get('user_id')
-    )
+    if update_data:
+        try:
+            before = await db.employees.find_one_and_update(
+                {'id': emp_id},
+                {'$set': update_data},
+                projection={'_id': 0},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="NIK atau Email sudah terdaftar")
+        if not before:
+            raise HTTPException(status_code=404, detail="Karyawan tidak ditemukan")
+        updated = {**before, **update_data}
+        await apply_employee_stats(before, updated)
+    else:
+        updated = emp
+    return (await build_employee_responses([updated]))[0]
 
 @api_router.delete("/employees/{emp_id}")
 async def delete_employee(
@@ -665,8 +925,14 @@ async def delete_employee(
     # Also delete associated user if exists
     if emp.get('user_id'):
         await db.users.delete_one({'id': emp['user_id']})
-    
-    await db.employees.delete_one({'id': emp_id})
+        user_cache.invalidate(emp['user_id'])
+    
+    deleted = await db.employees.find_one_and_delete({'id': emp_id}, projection={'_id': 0})
+    if deleted:
+        await apply_employee_stats(deleted, None)
+    # Other workers keep the rows until restart; /face/identify drops unknown employees
+    await db.face_data.delete_one({'employee_id': emp_id})
+    face_index.remove(emp_id)
     return {"message": "Karyawan berhasil dihapus"}
 
 # ===================== USER MANAGEMENT ROUTES =====================
@@ -697,6 +963,7 @@ async def update_user_role(
         raise HTTPException(status_code=404, detail="User tidak ditemukan")
     
     await db.users.update_one({'id': user_id}, {'$set': {'role': role}})
+    user_cache.invalidate(user_id)
     return {"message": "Role berhasil diubah"}
 
 @api_router.post("/users/{user_id}/link-employee/{emp_id}")
@@ -715,52 +982,161 @@ async def link_user_to_employee(
     
     await db.users.update_one({'id': user_id}, {'$set': {'employee_id': emp_id}})
     await db.employees.update_one({'id': emp_id}, {'$set': {'user_id': user_id}})
+    user_cache.invalidate(user_id)
     
     return {"message": "User berhasil dihubungkan dengan karyawan"}
 
 # ===================== DASHBOARD ROUTES =====================
 
+# The dashboard reads a single materialized document from `stats`. Employee
+# writes keep it current with $inc; rebuild_employee_stats() recomputes it from
+# scratch (startup when missing, POST /dashboard/stats/rebuild, manage.py).
+#
+# Every $inc also bumps `epoch`, and a rebuild only replaces the document if
+# the epoch it started from is unchanged, so counters applied while the
+# aggregation ran are never overwritten. What the guard cannot see is a write
+# whose employee change lands before the aggregation but whose $inc arrives
+# after the replace (double count), or a process dying between the two writes
+# (missed count). Both are corrected by the next rebuild; for an exact
+# reconciliation run it while employee writes are quiesced.
+STATS_EMPLOYEES_ID = 'employees'
+STATS_REBUILD_ATTEMPTS = 5
+
+def stats_key(value) -> str:
+    """Make a value safe to use as a field name inside the stats document"""
+    return str(value).replace('.', '_').replace('$', '_')
+
+def employee_stats_delta(emp: dict, sign: int) -> dict:
+    delta = {'total': sign, f"per_status.{stats_key(emp.get('status'))}": sign}
+    if emp.get('status') == 'aktif':
+        delta[f"aktif_per_departemen.{stats_key(emp.get('department_id'))}"] = sign
+    month = (emp.get('tanggal_bergabung') or '')[:7]
+    if month:
+        delta[f"baru_per_bulan.{stats_key(month)}"] = sign
+    return delta
+
+async def apply_employee_stats(before: Optional[dict], after: Optional[dict]):
+    """Apply the counter difference between two versions of an employee document"""
+    delta = {}
+    for emp, sign in ((before, -1), (after, 1)):
+        if emp:
+            for key, value in employee_stats_delta(emp, sign).items():
+                delta[key] = delta.get(key, 0) + value
+    delta = {k: v for k, v in delta.items() if v}
+    if delta:
+        delta['epoch'] = 1
+        # No upsert: a missing document is rebuilt in full on next read
+        await db.stats.update_one({'_id': STATS_EMPLOYEES_ID}, {'$inc': delta})
+
+def employee_stats_pipeline() -> list:
+    """Build the $facet pipeline that computes all employee counters in one pass"""
+    return [
+        {'$facet': {
+            'per_status': [
+                {'$group': {'_id': '$status', 'jumlah': {'$sum': 1}}}
+            ],
+            'aktif_per_departemen': [
+                {'$match': {'status': 'aktif'}},
+                {'$group': {'_id': '$department_id', 'jumlah': {'$sum': 1}}}
+            ],
+            'baru_per_bulan': [
+                {'$group': {'_id': {'$substrCP': ['$tanggal_bergabung', 0, 7]}, 'jumlah': {'$sum': 1}}}
+            ]
+        }}
+    ]
+
+async def compute_employee_stats() -> dict:
+    """Run the $facet pipeline and shape its output like the stats document"""
+    rows = await db.employees.aggregate(employee_stats_pipeline()).to_list(1)
+    facets = rows[0] if rows else {}
+    
+    per_status = {stats_key(r['_id']): r['jumlah'] for r in facets.get('per_status', [])}
+    return {
+        'total': sum(per_status.values()),
+        'per_status': per_status,
+        'aktif_per_departemen': {
+            stats_key(r['_id']): r['jumlah'] for r in facets.get('aktif_per_departemen', [])
+        },
+        'baru_per_bulan': {
+            stats_key(r['_id']): r['jumlah'] for r in facets.get('baru_per_bulan', []) if r['_id']
+        }
+    }
+
+async def rebuild_employee_stats() -> dict:
+    """Recompute the materialized employee counters from the employees collection"""
+    for _ in range(STATS_REBUILD_ATTEMPTS):
+        # A placeholder (no `rebuilt_at`) makes concurrent $inc writes bump the
+        # epoch even when the document did not exist before this rebuild
+        current = await db.stats.find_one_and_update(
+            {'_id': STATS_EMPLOYEES_ID},
+            {'$setOnInsert': {'epoch': 0}},
+            projection={'epoch': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        epoch = current.get('epoch', 0)
+        stats_doc = {
+            '_id': STATS_EMPLOYEES_ID,
+            **await compute_employee_stats(),
+            'epoch': epoch + 1,
+            'rebuilt_at': datetime.now(timezone.utc).isoformat()
+        }
+        result = await db.stats.replace_one({'_id': STATS_EMPLOYEES_ID, 'epoch': epoch}, stats_doc)
+        if result.matched_count:
+            return stats_doc
+    raise RuntimeError(f"Employee stats changed during {STATS_REBUILD_ATTEMPTS} rebuild attempts; retry later")
+
+def employee_stats_ready(stats_doc: Optional[dict]) -> bool:
+    """False for a missing document or a rebuild placeholder"""
+    return stats_doc is not None and 'rebuilt_at' in stats_doc
+
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(user: dict = Depends(get_current_user)):
-    total_karyawan = await db.employees.count_documents({})
-    karyawan_aktif = await db.employees.count_documents({'status': 'aktif'})
-    karyawan_nonaktif = await db.employees.count_documents({'status': {'$ne': 'aktif'}})
-    total_departemen = await db.departments.count_documents({})
-    total_posisi = await db.positions.count_documents({})
-    
-    # Karyawan per departemen
-    departments = await db.departments.find({}, {'_id': 0}).to_list(100)
-    karyawan_per_dept = []
-    for dept in departments:
-        count = await db.employees.count_documents({'department_id': dept['id'], 'status': 'aktif'})
-        karyawan_per_dept.append({'nama': dept['nama'], 'jumlah': count})
-    
-    # Karyawan per status
+    stats_doc, departments, total_posisi = await asyncio.gather(
+        db.stats.find_one({'_id': STATS_EMPLOYEES_ID}),
+        db.departments.find({}, {'_id': 0, 'id': 1, 'nama': 1}).to_list(None),
+        db.positions.count_documents({})
+    )
+    if not employee_stats_ready(stats_doc):
+        stats_doc = await rebuild_employee_stats()
+    
+    per_status = stats_doc.get('per_status', {})
+    aktif_per_dept = stats_doc.get('aktif_per_departemen', {})
+    total_karyawan = stats_doc.get('total', 0)
+    karyawan_aktif = per_status.get('aktif', 0)
+    
+    karyawan_per_dept = [
+        {'nama': dept['nama'], 'jumlah': aktif_per_dept.get(stats_key(dept['id']), 0)}
+        for dept in departments
+    ]
+    
     statuses = ['aktif', 'non-aktif', 'cuti', 'resign']
-    karyawan_per_status = []
-    for s in statuses:
-        count = await db.employees.count_documents({'status': s})
-        if count > 0:
-            karyawan_per_status.append({'status': s, 'jumlah': count})
+    karyawan_per_status = [
+        {'status': s, 'jumlah': per_status[s]}
+        for s in statuses if per_status.get(s, 0) > 0
+    ]
     
-    # Karyawan baru bulan ini
-    now = datetime.now(timezone.utc)
-    first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    karyawan_baru = await db.employees.count_documents({
-        'tanggal_bergabung': {'$gte': first_day.strftime('%Y-%m-%d')}
-    })
+    # Joins dated this month or later, matching the previous tanggal_bergabung >= first-day filter
+    current_month = datetime.now(timezone.utc).strftime('%Y-%m')
+    karyawan_baru = sum(n for month, n in stats_doc.get('baru_per_bulan', {}).items() if month >= current_month)
     
     return DashboardStats(
         total_karyawan=total_karyawan,
         karyawan_aktif=karyawan_aktif,
-        karyawan_nonaktif=karyawan_nonaktif,
-        total_departemen=total_departemen,
+        karyawan_nonaktif=total_karyawan - karyawan_aktif,
+        total_departemen=len(departments),
         total_posisi=total_posisi,
         karyawan_per_departemen=karyawan_per_dept,
         karyawan_per_status=karyawan_per_status,
         karyawan_baru_bulan_ini=karyawan_baru
     )
 
+@api_router.post("/dashboard/stats/rebuild")
+async def rebuild_dashboard_stats(user: dict = Depends(require_role(['super_admin', 'hr']))):
+    """Reconcile the materialized dashboard counters with the employees collection"""
+    stats_doc = await rebuild_employee_stats()
+    return {"message": "Statistik berhasil dihitung ulang", "total_karyawan": stats_doc['total']}
+
 # ===================== ATTENDANCE MODELS =====================
 
 class OfficeLocation(BaseModel):
@@ -771,14 +1147,34 @@ class OfficeLocation(BaseModel):
     radius: int = 100  # in meters
     is_default: bool = False
 
+class OfficeLocationCreate(BaseModel):
+    nama: str
+    latitude: float
+    longitude: float
+    radius: int = 100
+    is_default: bool = False
+
+class OfficeLocationUpdate(BaseModel):
+    nama: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius: Optional[int] = None
+    is_default: Optional[bool] = None
+
+class WorkHoursUpdate(BaseModel):
+    start: str  # HH:MM
+    end: str  # HH:MM
+    late_tolerance_minutes: int = 15
+
 class AttendanceCreate(BaseModel):
     tipe: str  # clock_in, clock_out
     mode: str  # wfo, wfh, client_visit
     latitude: float
     longitude: float
-    foto_url: str  # base64 or URL of selfie
+    foto_url: str  # base64 data URL, /api/photos reference or URL of selfie
     catatan: Optional[str] = None
     alamat_client: Optional[str] = None  # for client visit
+    face_descriptor: Optional[List[float]] = None  # live descriptor for server-side face verification
 
 class AttendanceResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -791,17 +1187,34 @@ class AttendanceResponse(BaseModel):
     clock_in_latitude: Optional[float] = None
     clock_in_longitude: Optional[float] = None
     clock_in_mode: Optional[str] = None
+    clock_in_office: Optional[str] = None  # matched office for WFO
+    clock_in_distance: Optional[float] = None  # meters to that office
     clock_out: Optional[str] = None
     clock_out_foto: Optional[str] = None
     clock_out_latitude: Optional[float] = None
     clock_out_longitude: Optional[float] = None
     clock_out_mode: Optional[str] = None
+    clock_out_office: Optional[str] = None
+    clock_out_distance: Optional[float] = None
+    clock_in_face_distance: Optional[float] = None  # set when verified server-side
+    clock_out_face_distance: Optional[float] = None
     total_jam: Optional[float] = None
     status: str  # hadir, terlambat, alpha, izin
     catatan: Optional[str] = None
+    clock_in_thumb: Optional[str] = None
+    clock_out_thumb: Optional[str] = None
+
+class AttendancePageResponse(BaseModel):
+    items: List[AttendanceResponse]
+    next_cursor: Optional[str] = None
 
 class FaceDataCreate(BaseModel):
     face_descriptor: List[float]  # 128-dimensional face descriptor
+    reset: bool = False  # drop previously registered templates
+
+class FaceIdentifyRequest(BaseModel):
+    face_descriptor: List[float]
+    k: int = Field(5, ge=1, le=20)
 
 class AttendanceStats(BaseModel):
     total_hari_kerja: int
@@ -810,7 +1223,9 @@ class AttendanceStats(BaseModel):
     total_alpha: int
     persentase_kehadiran: float
 
-# Office location settings
+# Defaults seeded into the database on first startup; afterwards offices and
+# work hours are managed through the /attendance/offices and
+# /attendance/settings/work-hours endpoints.
 OFFICE_LOCATIONS = [
     {
         'id': 'office-main',
@@ -828,46 +1243,649 @@ WORK_HOURS = {
     'late_tolerance_minutes': 15
 }
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two points in meters using Haversine formula"""
-    from math import radians, cos, sin, asin, sqrt
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371000  # Earth radius in meters
-    return c * r
-
-def is_within_office(lat: float, lon: float) -> tuple:
-    """Check if coordinates are within any office location"""
-    for office in OFFICE_LOCATIONS:
-        distance = calculate_distance(lat, lon, office['latitude'], office['longitude'])
-        if distance <= office['radius']:
-            return True, office['nama'], distance
-    return False, None, None
-
-def is_late(clock_in_time: datetime) -> bool:
-    """Check if clock in time is late"""
-    start_hour, start_minute = map(int, WORK_HOURS['start'].split(':'))
-    tolerance = WORK_HOURS['late_tolerance_minutes']
+# Offices live in the `offices` collection; work hours and the settings
+# version live in `settings`. Geofence checks run in memory (haversine_matrix).
+SETTINGS_ID = 'attendance'
+SETTINGS_CHECK_SECONDS = float(os.environ.get('SETTINGS_CHECK_SECONDS', '2'))
+EARTH_RADIUS_M = 6371000
+
+def haversine_matrix(lat: np.ndarray, lon: np.ndarray, office_lat: np.ndarray, office_lon: np.ndarray) -> np.ndarray:
+    """Distances in meters from every point (rows) to every office (columns); inputs in radians"""
+    dlat = office_lat[None, :] - lat[:, None]
+    dlon = office_lon[None, :] - lon[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(office_lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+async def seed_attendance_settings():
+    """Insert the default offices and work hours into an empty database"""
+    if await db.offices.find_one({}, {'_id': 1}) is None:
+        await db.offices.insert_many([dict(o) for o in OFFICE_LOCATIONS])
+    # GeoJSON copies written by earlier versions; nothing queries them
+    await db.offices.update_many({'lokasi': {'$exists': True}}, {'$unset': {'lokasi': ''}})
+    await db.settings.update_one(
+        {'_id': SETTINGS_ID},
+        {'$setOnInsert': {'work_hours': WORK_HOURS, 'version': 1}},
+        upsert=True
+    )
+
+async def bump_settings_version(field: str = 'version'):
+    """Mark cached settings as changed so every worker reloads them
+
+    `version` covers offices and work hours, `schedule_version` covers shifts
+    and shift assignments.
+    """
+    await db.settings.update_one(
+        {'_id': SETTINGS_ID},
+        {'$inc': {field: 1}, '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    attendance_settings.invalidate()
+
+class AttendanceSettingsCache:
+    """Offices, work hours and shift schedules held in memory, reloaded on version change
+
+    Each worker compares its cached versions with the database at most once per
+    SETTINGS_CHECK_SECONDS (a single `_id` lookup), so a change written through
+    any worker is picked up by all of them within that interval.
+    """
+
+    def __init__(self, check_seconds: float):
+        self.check_seconds = check_seconds
+        self.version = None
+        self.schedule_version = None
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.offices = []
+        self.work_hours = dict(WORK_HOURS)
+        self.office_lat = np.empty(0)
+        self.office_lon = np.empty(0)
+        self.office_radius = np.empty(0)
+        self.schedules = {}  # employee_id -> [(tanggal_mulai, tanggal_selesai, shift)], newest first
+        self._lock = asyncio.Lock()
+
+    def fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self.checked_at < self.check_seconds
+
+    async def get(self) -> 'AttendanceSettingsCache':
+        if self.fresh():
+            return self
+        async with self._lock:
+            if self.fresh():
+                return self
+            doc = await db.settings.find_one({'_id': SETTINGS_ID}, {'_id': 0, 'version': 1, 'schedule_version': 1}) or {}
+            version = doc.get('version', 0)
+            schedule_version = doc.get('schedule_version', 0)
+            if version != self.version:
+                await self.reload(version)
+            if schedule_version != self.schedule_version:
+                await self.reload_schedules(schedule_version)
+            self.checked_at = time.monotonic()
+        return self
+
+    async def reload(self, version: int):
+        doc = await db.settings.find_one({'_id': SETTINGS_ID}, {'_id': 0, 'work_hours': 1}) or {}
+        offices = await db.offices.find({}, {'_id': 0}).to_list(None)
+        self.offices = offices
+        self.work_hours = doc.get('work_hours') or dict(WORK_HOURS)
+        self.office_lat = np.radians([o['latitude'] for o in offices])
+        self.office_lon = np.radians([o['longitude'] for o in offices])
+        self.office_radius = np.array([o['radius'] for o in offices], dtype=np.float64)
+        self.version = version
+        self.reloads += 1
+
+    async def reload_schedules(self, schedule_version: int):
+        shifts = await db.shifts.find({}, {'_id': 0, 'id': 1, 'nama': 1, 'jam_masuk': 1, 'jam_keluar': 1}).to_list(None)
+        shifts_by_id = {s['id']: s for s in shifts}
+        schedules = {}
+        # Newest tanggal_mulai first (id breaks ties), so overlapping
+        # assignments resolve the same way on every worker
+        cursor = db.shift_assignments.find(
+            {}, {'_id': 0, 'id': 1, 'employee_id': 1, 'shift_id': 1, 'tanggal_mulai': 1, 'tanggal_selesai': 1}
+        ).sort([('tanggal_mulai', -1), ('id', -1)])
+        async for a in cursor:
+            shift = shifts_by_id.get(a['shift_id'])
+            if shift:
+                schedules.setdefault(a['employee_id'], []).append((a['tanggal_mulai'], a.get('tanggal_selesai'), shift))
+        self.schedules = schedules
+        self.schedule_version = schedule_version
+        self.reloads += 1
+
+    def shift_for(self, employee_id: str, tanggal: str) -> Optional[dict]:
+        """Active shift of an employee on a date (YYYY-MM-DD), if any; the most recently started wins"""
+        for mulai, selesai, shift in self.schedules.get(employee_id, ()):
+            if mulai <= tanggal and (selesai is None or tanggal <= selesai):
+                return shift
+        return None
+
+    def work_hours_for(self, employee_id: str, tanggal: str) -> dict:
+        """Work hours that apply to an employee: their shift if assigned, else the global hours"""
+        shift = self.shift_for(employee_id, tanggal)
+        if shift is None:
+            return self.work_hours
+        return {**self.work_hours, 'start': shift['jam_masuk'], 'end': shift['jam_keluar'], 'shift_id': shift['id']}
+
+    def invalidate(self):
+        self.checked_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'version': self.version,
+            'schedule_version': self.schedule_version,
+            'offices': len(self.offices),
+            'scheduled_employees': len(self.schedules),
+            'reloads': self.reloads,
+            'check_seconds': self.check_seconds
+        }
+
+attendance_settings = AttendanceSettingsCache(SETTINGS_CHECK_SECONDS)
+
+async def is_within_office(lat: float, lon: float) -> tuple:
+    """Check coordinates against every cached office; returns (within, office, distance)
+
+    Among the offices whose radius covers the point the nearest one wins. When
+    none does, the nearest office and its distance are returned for the error message.
+    """
+    config = await attendance_settings.get()
+    if not config.offices:
+        return False, None, None
+    distances = haversine_matrix(np.radians([lat]), np.radians([lon]), config.office_lat, config.office_lon)[0]
+    covering = np.flatnonzero(distances <= config.office_radius)
+    nearest = covering[distances[covering].argmin()] if len(covering) else distances.argmin()
+    return bool(len(covering)), config.offices[nearest], float(distances[nearest])
+
+def is_late(clock_in_time: datetime, work_hours: dict) -> bool:
+    """Check if clock in time is late
+
+    Global work hours compare against the deadline on the clock-in day. For a
+    shift (`shift_id` set by work_hours_for) the deadline is taken on whichever
+    day puts it within 12 hours of the clock-in, so a 22:00 shift clocked in
+    at 00:30 is late and a 00:00 shift clocked in at 23:50 is not.
+    """
+    start_hour, start_minute = map(int, work_hours['start'].split(':'))
+    tolerance = work_hours['late_tolerance_minutes']
     
     deadline = clock_in_time.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)
     deadline += timedelta(minutes=tolerance)
+    if work_hours.get('shift_id'):
+        if deadline - clock_in_time > timedelta(hours=12):
+            deadline -= timedelta(days=1)
+        elif clock_in_time - deadline > timedelta(hours=12):
+            deadline += timedelta(days=1)
     
     return clock_in_time > deadline
 
+# ===================== GEOFENCE AUDIT =====================
+
+GEOFENCE_AUDIT_CHUNK_SIZE = int(os.environ.get('GEOFENCE_AUDIT_CHUNK_SIZE', '5000'))
+GEOFENCE_AUDIT_MAX_FLAGGED = 1000
+
+def check_geofence_chunk(coords: np.ndarray, office_lat: np.ndarray, office_lon: np.ndarray, office_radius: np.ndarray) -> tuple:
+    """Return (within any radius, nearest office index, distance to it) for each (lat, lon) row"""
+    distances = haversine_matrix(np.radians(coords[:, 0]), np.radians(coords[:, 1]), office_lat, office_lon)
+    within = (distances <= office_radius[None, :]).any(axis=1)
+    nearest = distances.argmin(axis=1)
+    return within, nearest, distances[np.arange(len(coords)), nearest]
+
+async def audit_geofence(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    chunk_size: int = GEOFENCE_AUDIT_CHUNK_SIZE,
+    max_flagged: Optional[int] = GEOFENCE_AUDIT_MAX_FLAGGED
+) -> dict:
+    """Re-check every WFO clock-in against all offices, chunk by chunk
+
+    Coordinates are streamed from the cursor in chunks of `chunk_size`; each
+    chunk is checked against every office in one NumPy distance matrix on a
+    worker thread so the event loop keeps serving requests.
+    """
+    offices = await db.offices.find({}, {'_id': 0, 'id': 1, 'nama': 1, 'latitude': 1, 'longitude': 1, 'radius': 1}).to_list(None)
+    if not offices:
+        raise HTTPException(status_code=400, detail="Belum ada lokasi kantor")
+    office_lat = np.radians([o['latitude'] for o in offices])
+    office_lon = np.radians([o['longitude'] for o in offices])
+    office_radius = np.array([o['radius'] for o in offices], dtype=np.float64)
+    
+    query = {'clock_in_mode': 'wfo', 'clock_in_latitude': {'$ne': None}, 'clock_in_longitude': {'$ne': None}}
+    if start_date or end_date:
+        query['tanggal'] = {}
+        if start_date:
+            query['tanggal']['$gte'] = start_date
+        if end_date:
+            query['tanggal']['$lte'] = end_date
+    
+    def check_rows(rows: List[dict]) -> List[dict]:
+        coords = np.array([(r['clock_in_latitude'], r['clock_in_longitude']) for r in rows], dtype=np.float64)
+        within, nearest, distance = check_geofence_chunk(coords, office_lat, office_lon, office_radius)
+        return [
+            {
+                'id': rows[i]['id'],
+                'employee_id': rows[i]['employee_id'],
+                'tanggal': rows[i]['tanggal'],
+                'latitude': rows[i]['clock_in_latitude'],
+                'longitude': rows[i]['clock_in_longitude'],
+                'kantor_terdekat': offices[nearest[i]]['nama'],
+                'jarak': round(float(distance[i]), 1)
+            }
+            for i in np.flatnonzero(~within)
+        ]
+    
+    started = time.perf_counter()
+    checked = 0
+    flagged_total = 0
+    flagged = []
+    
+    async def flush(rows: List[dict]):
+        nonlocal checked, flagged_total
+        out_of_radius = await asyncio.to_thread(check_rows, rows)
+        checked += len(rows)
+        flagged_total += len(out_of_radius)
+        if max_flagged is None:
+            flagged.extend(out_of_radius)
+        else:
+            flagged.extend(out_of_radius[:max_flagged - len(flagged)])
+    
+    cursor = db.attendance.find(
+        query,
+        {'_id': 0, 'id': 1, 'employee_id': 1, 'tanggal': 1, 'clock_in_latitude': 1, 'clock_in_longitude': 1}
+    ).batch_size(chunk_size)
+    rows = []
+    async for att in cursor:
+        rows.append(att)
+        if len(rows) == chunk_size:
+            await flush(rows)
+            rows = []
+    if rows:
+        await flush(rows)
+    
+    elapsed = time.perf_counter() - started
+    return {
+        'jumlah_kantor': len(offices),
+        'total_diperiksa': checked,
+        'total_di_luar_radius': flagged_total,
+        'durasi_detik': round(elapsed, 3),
+        'record_per_detik': round(checked / elapsed) if elapsed > 0 else 0,
+        'di_luar_radius': flagged
+    }
+
+@api_router.get("/attendance/audit/geofence")
+async def get_geofence_audit(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = Query(100, ge=0, le=GEOFENCE_AUDIT_MAX_FLAGGED),
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Audit historical WFO clock-ins against the current office radii"""
+    return await audit_geofence(start_date, end_date, max_flagged=limit)
+
+# ===================== PHOTO STORE =====================
+
+PHOTO_URL_PREFIX = '/api/photos/'
+PHOTO_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def photo_bucket() -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(db, bucket_name=PHOTO_BUCKET)
+
+def detect_image_type(content: bytes) -> Optional[str]:
+    if content.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if content.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def validate_photo(content: bytes) -> str:
+    """Check size and format of image bytes and return the photo id (SHA-256)"""
+    if len(content) > PHOTO_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Ukuran foto terlalu besar")
+    if not detect_image_type(content):
+        raise HTTPException(status_code=400, detail="Format foto tidak didukung")
+    return hashlib.sha256(content).hexdigest()
+
+async def store_photo(content: bytes) -> str:
+    """Store image bytes once per distinct content and return the photo id (SHA-256)"""
+    photo_id = validate_photo(content)
+    files = db[f'{PHOTO_BUCKET}.files']
+    if await files.find_one({'filename': photo_id}, {'_id': 1}):
+        return photo_id
+    
+    grid_in = photo_bucket().open_upload_stream(
+        photo_id, metadata={'content_type': detect_image_type(content)}
+    )
+    try:
+        await grid_in.write(content)
+        await grid_in.close()
+    except FileExists:
+        # A concurrent upload of the same bytes won the unique filename index;
+        # drop the chunks this attempt already wrote.
+        await db[f'{PHOTO_BUCKET}.chunks'].delete_many({'files_id': grid_in._id})
+    return photo_id
+
+def photo_url(photo_id: str) -> str:
+    return f'{PHOTO_URL_PREFIX}{photo_id}'
+
+def thumbnail_url(photo_id: str) -> str:
+    return f'{PHOTO_URL_PREFIX}{photo_id}/thumb'
+
+def photo_id_from_url(foto: Optional[str]) -> Optional[str]:
+    if foto and foto.startswith(PHOTO_URL_PREFIX):
+        photo_id = foto[len(PHOTO_URL_PREFIX):]
+        if PHOTO_ID_PATTERN.match(photo_id):
+            return photo_id
+    return None
+
+def photo_cache_headers(etag: str) -> dict:
+    # Content never changes for a given id
+    return {'Cache-Control': 'private, max-age=31536000, immutable', 'ETag': f'"{etag}"'}
+
+# ===================== THUMBNAILS =====================
+
+_thumbnail_executor = None
+thumbnail_tasks = set()
+
+def thumbnail_executor() -> ProcessPoolExecutor:
+    # Created on first use so importing the module (CLI, reload) does not start
+    # workers. `spawn`, not fork: forking a process that already runs Motor and
+    # uvicorn threads can leave locks held in the child.
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        _thumbnail_executor = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _thumbnail_executor
+
+def shutdown_thumbnail_executor():
+    global _thumbnail_executor
+    if _thumbnail_executor is not None:
+        _thumbnail_executor.shutdown(wait=False, cancel_futures=True)
+        _thumbnail_executor = None
+
+async def render_thumbnail(content: bytes, size: int = THUMBNAIL_SIZE) -> Optional[bytes]:
+    """Run make_thumbnail in the process pool; None if the image cannot be decoded"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(thumbnail_executor(), make_thumbnail, content, size)
+    except THUMBNAIL_ERRORS as e:
+        logger.warning("Could not create thumbnail: %s: %s", type(e).__name__, e)
+        return None
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool next time
+        logger.warning("Thumbnail worker pool broke; restarting it")
+        shutdown_thumbnail_executor()
+        return None
+
+async def ensure_thumbnail(photo_id: str) -> Optional[bytes]:
+    """Return the stored thumbnail of a photo, generating it in the process pool if missing"""
+    bucket = photo_bucket()
+    thumb_name = f'{photo_id}_thumb'
+    try:
+        stream = await bucket.open_download_stream_by_name(thumb_name)
+        return await stream.read()
+    except NoFile:
+        pass
+    
+    try:
+        stream = await bucket.open_download_stream_by_name(photo_id)
+    except NoFile:
+        return None
+    content = await stream.read()
+    
+    thumb = await render_thumbnail(content)
+    if thumb is None:
+        return None
+    grid_in = bucket.open_upload_stream(thumb_name, metadata={'content_type': 'image/jpeg', 'source': photo_id})
+    try:
+        await grid_in.write(thumb)
+        await grid_in.close()
+    except FileExists:
+        # Another request rendered the same thumbnail first; keep theirs and
+        # drop the chunks this attempt already wrote.
+        await db[f'{PHOTO_BUCKET}.chunks'].delete_many({'files_id': grid_in._id})
+    return thumb
+
+def schedule_thumbnail(photo_id: str):
+    """Generate a thumbnail in the background without delaying the current request"""
+    task = asyncio.create_task(ensure_thumbnail(photo_id))
+    thumbnail_tasks.add(task)
+    task.add_done_callback(thumbnail_done)
+
+def thumbnail_done(task: asyncio.Task):
+    thumbnail_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background thumbnail failed: %r", task.exception())
+
+def decode_photo_reference(foto: Optional[str]) -> Tuple[Optional[str], Optional[bytes]]:
+    """Validate a foto_url value and return (reference to store, bytes still to upload).
+    Inline base64 selfies get their /api/photos/ reference up front so callers
+    can write the record first and upload afterwards; other references pass through."""
+    if not foto or foto.startswith(PHOTO_URL_PREFIX) or foto.startswith(('http://', 'https://')):
+        return foto, None
+    
+    payload = foto.split(',', 1)[1] if foto.startswith('data:') else foto
+    try:
+        content = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Foto tidak valid")
+    return photo_url(validate_photo(content)), content
+
+async def resolve_photo_reference(foto: Optional[str]) -> Optional[str]:
+    """Move inline base64 selfies into the photo store; other references pass through"""
+    reference, content = decode_photo_reference(foto)
+    if content is not None:
+        await store_photo(content)
+    return reference
+
+@api_router.post("/photos")
+async def upload_photo(
+    file: UploadFile = File(...),
+    user: dict = Depends(get_current_user)
+):
+    """Upload a selfie and get a reference usable as AttendanceCreate.foto_url"""
+    content = await file.read(PHOTO_MAX_BYTES + 1)
+    photo_id = await store_photo(content)
+    return {"id": photo_id, "url": photo_url(photo_id)}
+
+async def check_photo_access(photo_id: str, user: dict):
+    """HR, managers and the employee whose attendance record references the photo may view it"""
+    if not PHOTO_ID_PATTERN.match(photo_id):
+        raise HTTPException(status_code=404, detail="Foto tidak ditemukan")
+    if user['role'] in ['super_admin', 'hr', 'manager']:
+        return
+    
+    url = photo_url(photo_id)
+    own = user.get('employee_id') and await db.attendance.find_one(
+        {'employee_id': user['employee_id'], '$or': [{'clock_in_foto': url}, {'clock_out_foto': url}]},
+        {'_id': 1}
+    )
+    if not own:
+        raise HTTPException(status_code=403, detail="Akses ditolak")
+
+@api_router.get("/photos/{photo_id}")
+async def get_photo(photo_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Serve a stored photo to HR/managers or the employee it belongs to"""
+    await check_photo_access(photo_id, user)
+    
+    headers = photo_cache_headers(photo_id)
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        stream = await photo_bucket().open_download_stream_by_name(photo_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Foto tidak ditemukan")
+    content = await stream.read()
+    media_type = (stream.metadata or {}).get('content_type', 'application/octet-stream')
+    return Response(content=content, media_type=media_type, headers=headers)
+
+@api_router.get("/photos/{photo_id}/thumb")
+async def get_photo_thumbnail(photo_id: str, request: Request, user: dict = Depends(get_current_user)):
+    """Serve the small JPEG thumbnail of a stored photo, generating it on first request if needed"""
+    await check_photo_access(photo_id, user)
+    
+    headers = photo_cache_headers(f'{photo_id}-thumb')
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    
+    thumb = await ensure_thumbnail(photo_id)
+    if thumb is None:
+        # Missing photo, or one Pillow cannot decode (corrupt, oversized)
+        raise HTTPException(status_code=404, detail="Thumbnail tidak tersedia")
+    return Response(content=thumb, media_type='image/jpeg', headers=headers)
+
+async def migrate_attendance_photos() -> int:
+    """Move inline base64 selfies of existing attendance records into the photo store"""
+    migrated = 0
+    cursor = db.attendance.find(
+        {'$or': [
+            {'clock_in_foto': {'$regex': '^data:'}},
+            {'clock_out_foto': {'$regex': '^data:'}}
+        ]},
+        {'_id': 0, 'id': 1, 'clock_in_foto': 1, 'clock_out_foto': 1}
+    )
+    async for att in cursor:
+        update = {}
+        for prefix in ('clock_in', 'clock_out'):
+            field = f'{prefix}_foto'
+            foto = att.get(field)
+            if foto and foto.startswith('data:'):
+                try:
+                    update[field] = await resolve_photo_reference(foto)
+                except HTTPException as e:
+                    logger.warning("Skipping %s of attendance %s: %s", field, att['id'], e.detail)
+                    continue
+                update[f'{prefix}_thumb'] = thumbnail_url(photo_id_from_url(update[field]))
+        if update:
+            await db.attendance.update_one({'id': att['id']}, {'$set': update})
+            migrated += 1
+    return migrated
+
 # ===================== ATTENDANCE ROUTES =====================
 
+def build_attendance_response(att: dict, employee_nama: Optional[str]) -> AttendanceResponse:
+    return AttendanceResponse(
+        id=att['id'],
+        employee_id=att['employee_id'],
+        employee_nama=employee_nama,
+        tanggal=att['tanggal'],
+        clock_in=att.get('clock_in'),
+        clock_in_foto=att.get('clock_in_foto'),
+        clock_in_thumb=att.get('clock_in_thumb'),
+        clock_in_latitude=att.get('clock_in_latitude'),
+        clock_in_longitude=att.get('clock_in_longitude'),
+        clock_in_mode=att.get('clock_in_mode'),
+        clock_in_office=att.get('clock_in_office'),
+        clock_in_distance=att.get('clock_in_distance'),
+        clock_out=att.get('clock_out'),
+        clock_out_foto=att.get('clock_out_foto'),
+        clock_out_thumb=att.get('clock_out_thumb'),
+        clock_out_latitude=att.get('clock_out_latitude'),
+        clock_out_longitude=att.get('clock_out_longitude'),
+        clock_out_mode=att.get('clock_out_mode'),
+        clock_out_office=att.get('clock_out_office'),
+        clock_out_distance=att.get('clock_out_distance'),
+        clock_in_face_distance=att.get('clock_in_face_distance'),
+        clock_out_face_distance=att.get('clock_out_face_distance'),
+        total_jam=att.get('total_jam'),
+        status=att['status'],
+        catatan=att.get('catatan')
+    )
+
+async def build_attendance_responses(
+    rows: List[dict],
+    employee_names: Optional[dict] = None
+) -> List[AttendanceResponse]:
+    """Build responses with all employee names resolved in one $in query"""
+    if employee_names is None:
+        employee_names = await fetch_names(db.employees, (r['employee_id'] for r in rows), 'nama_lengkap')
+    return [build_attendance_response(r, employee_names.get(r['employee_id'])) for r in rows]
+
+def attendance_projection(include_photos: bool) -> dict:
+    """List endpoints skip selfie references unless explicitly requested"""
+    if include_photos:
+        return {'_id': 0}
+    return {'_id': 0, 'clock_in_foto': 0, 'clock_out_foto': 0}
+
 @api_router.get("/attendance/settings")
 async def get_attendance_settings(user: dict = Depends(get_current_user)):
     """Get attendance settings including office locations and work hours"""
+    config = await attendance_settings.get()
     return {
-        "office_locations": OFFICE_LOCATIONS,
-        "work_hours": WORK_HOURS
+        "office_locations": config.offices,
+        "work_hours": config.work_hours,
+        "version": config.version
     }
 
+def validate_office(office: dict):
+    if not -90 <= office['latitude'] <= 90 or not -180 <= office['longitude'] <= 180:
+        raise HTTPException(status_code=400, detail="Koordinat kantor tidak valid")
+    if office['radius'] <= 0:
+        raise HTTPException(status_code=400, detail="Radius kantor harus lebih dari 0")
+
+def validate_clock_times(*values: str):
+    """Work hours and shift times feed is_late on every clock-in; reject anything but HH:MM"""
+    for value in values:
+        try:
+            datetime.strptime(value, '%H:%M')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Format jam tidak valid (HH:MM)")
+
+@api_router.put("/attendance/settings/work-hours")
+async def update_work_hours(
+    data: WorkHoursUpdate,
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Update work hours used for lateness"""
+    validate_clock_times(data.start, data.end)
+    if data.late_tolerance_minutes < 0:
+        raise HTTPException(status_code=400, detail="Toleransi keterlambatan tidak valid")
+    
+    work_hours = data.model_dump()
+    await db.settings.update_one({'_id': SETTINGS_ID}, {'$set': {'work_hours': work_hours}}, upsert=True)
+    await bump_settings_version()
+    return {"message": "Jam kerja berhasil diupdate", "work_hours": work_hours}
+
+@api_router.post("/attendance/offices", response_model=OfficeLocation)
+async def create_office(
+    data: OfficeLocationCreate,
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Add an office location"""
+    office = {'id': str(uuid.uuid4()), **data.model_dump()}
+    validate_office(office)
+    await db.offices.insert_one(dict(office))
+    await bump_settings_version()
+    return OfficeLocation(**office)
+
+@api_router.put("/attendance/offices/{office_id}", response_model=OfficeLocation)
+async def update_office(
+    office_id: str,
+    data: OfficeLocationUpdate,
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Update an office location"""
+    office = await db.offices.find_one({'id': office_id}, {'_id': 0})
+    if not office:
+        raise HTTPException(status_code=404, detail="Kantor tidak ditemukan")
+    
+    office.update({k: v for k, v in data.model_dump().items() if v is not None})
+    validate_office(office)
+    await db.offices.replace_one({'id': office_id}, office)
+    await bump_settings_version()
+    return OfficeLocation(**office)
+
+@api_router.delete("/attendance/offices/{office_id}")
+async def delete_office(
+    office_id: str,
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Delete an office location"""
+    result = await db.offices.delete_one({'id': office_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Kantor tidak ditemukan")
+    await bump_settings_version()
+    return {"message": "Kantor berhasil dihapus"}
+
 @api_router.post("/attendance/clock", response_model=AttendanceResponse)
 async def clock_attendance(
     data: AttendanceCreate,
@@ -881,129 +1899,147 @@ async def clock_attendance(
     now = datetime.now(timezone.utc)
     today = now.strftime('%Y-%m-%d')
     
-    # Get employee data
-    employee = await db.employees.find_one({'id': employee_id}, {'_id': 0})
-    if not employee:
-        raise HTTPException(status_code=404, detail="Data karyawan tidak ditemukan")
+    # Validate type and mode
+    if data.tipe not in ['clock_in', 'clock_out']:
+        raise HTTPException(status_code=400, detail="Tipe tidak valid (clock_in/clock_out)")
     
-    # Validate mode
     if data.mode not in ['wfo', 'wfh', 'client_visit']:
         raise HTTPException(status_code=400, detail="Mode tidak valid")
     
-    # For WFO, validate location
+    # For WFO, validate location against the nearest offices
+    office_name, office_distance = None, None
     if data.mode == 'wfo':
-        within_office, office_name, distance = is_within_office(data.latitude, data.longitude)
+        within_office, office, distance = await is_within_office(data.latitude, data.longitude)
         if not within_office:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Lokasi Anda tidak dalam radius kantor. Jarak: {int(distance) if distance else 'unknown'}m"
+                detail=f"Lokasi Anda tidak dalam radius kantor. Jarak: {int(distance) if distance is not None else 'unknown'}m"
             )
+        office_name, office_distance = office['nama'], round(distance, 1)
     
     # For client visit, require address
     if data.mode == 'client_visit' and not data.alamat_client:
         raise HTTPException(status_code=400, detail="Alamat client wajib diisi untuk mode Client Visit")
     
-    # Get or create today's attendance record
-    attendance = await db.attendance.find_one({
-        'employee_id': employee_id,
-        'tanggal': today
-    }, {'_id': 0})
+    # Optional server-side face verification against the in-memory face index
+    face_distance = None
+    if data.face_descriptor is not None:
+        face_distance = round(await verify_face(employee_id, data.face_descriptor), 4)
+    elif FACE_VERIFICATION_REQUIRED:
+        raise HTTPException(status_code=400, detail="Verifikasi wajah wajib untuk absensi")
+    
+    # Get employee data
+    employee = await db.employees.find_one({'id': employee_id}, {'_id': 0, 'nama_lengkap': 1})
+    if not employee:
+        raise HTTPException(status_code=404, detail="Data karyawan tidak ditemukan")
     
+    # The selfie is validated and hashed now but uploaded only after the record
+    # write succeeds, so rejected taps leave no orphan files in the photo store
+    foto, foto_content = decode_photo_reference(data.foto_url)
+    photo_id = photo_id_from_url(foto)
+    
+    # Each branch is a single conditional write against the unique
+    # (employee_id, tanggal) index, so concurrent taps cannot create two records.
     if data.tipe == 'clock_in':
-        if attendance and attendance.get('clock_in'):
-            raise HTTPException(status_code=400, detail="Anda sudah clock in hari ini")
-        
-        # Determine status
-        status = 'terlambat' if is_late(now) else 'hadir'
-        
-        if attendance:
-            # Update existing record
-            await db.attendance.update_one(
-                {'id': attendance['id']},
-                {'$set': {
-                    'clock_in': now.isoformat(),
-                    'clock_in_foto': data.foto_url,
-                    'clock_in_latitude': data.latitude,
-                    'clock_in_longitude': data.longitude,
-                    'clock_in_mode': data.mode,
-                    'status': status,
-                    'catatan': data.catatan or data.alamat_client
-                }}
+        # Shift schedules come from the in-memory cache: no extra round trip
+        config = await attendance_settings.get()
+        status = 'terlambat' if is_late(now, config.work_hours_for(employee_id, today)) else 'hadir'
+        try:
+            updated = await db.attendance.find_one_and_update(
+                {'employee_id': employee_id, 'tanggal': today, 'clock_in': None},
+                {
+                    '$set': {
+                        'clock_in': now.isoformat(),
+                        'clock_in_foto': foto,
+                        'clock_in_thumb': thumbnail_url(photo_id) if photo_id else None,
+                        'clock_in_latitude': data.latitude,
+                        'clock_in_longitude': data.longitude,
+                        'clock_in_mode': data.mode,
+                        'clock_in_office': office_name,
+                        'clock_in_distance': office_distance,
+                        'clock_in_face_distance': face_distance,
+                        'status': status,
+                        'catatan': data.catatan or data.alamat_client
+                    },
+                    '$setOnInsert': {
+                        'id': str(uuid.uuid4()),
+                        'clock_out': None,
+                        'clock_out_foto': None,
+                        'clock_out_thumb': None,
+                        'clock_out_latitude': None,
+                        'clock_out_longitude': None,
+                        'clock_out_mode': None,
+                        'clock_out_office': None,
+                        'clock_out_distance': None,
+                        'clock_out_face_distance': None,
+                        'total_jam': None
+                    }
+                },
+                projection={'_id': 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
             )
-            attendance_id = attendance['id']
-        else:
-            # Create new record
-            attendance_id = str(uuid.uuid4())
-            await db.attendance.insert_one({
-                'id': attendance_id,
-                'employee_id': employee_id,
-                'tanggal': today,
-                'clock_in': now.isoformat(),
-                'clock_in_foto': data.foto_url,
-                'clock_in_latitude': data.latitude,
-                'clock_in_longitude': data.longitude,
-                'clock_in_mode': data.mode,
-                'clock_out': None,
-                'clock_out_foto': None,
-                'clock_out_latitude': None,
-                'clock_out_longitude': None,
-                'clock_out_mode': None,
-                'total_jam': None,
-                'status': status,
-                'catatan': data.catatan or data.alamat_client
-            })
-    
-    elif data.tipe == 'clock_out':
-        if not attendance or not attendance.get('clock_in'):
-            raise HTTPException(status_code=400, detail="Anda belum clock in hari ini")
-        
-        if attendance.get('clock_out'):
-            raise HTTPException(status_code=400, detail="Anda sudah clock out hari ini")
-        
-        # Calculate total hours
-        clock_in_time = datetime.fromisoformat(attendance['clock_in'])
-        total_hours = (now - clock_in_time).total_seconds() / 3600
-        
-        await db.attendance.update_one(
-            {'id': attendance['id']},
-            {'$set': {
+        except DuplicateKeyError:
+            # Today's record exists and already has a clock_in
+            raise HTTPException(status_code=400, detail="Anda sudah clock in hari ini")
+    
+    else:
+        # clock_in is stored as a UTC ISO string; its first 19 characters parse as UTC
+        clock_in_date = {'$dateFromString': {'dateString': {'$substrCP': ['$clock_in', 0, 19]}, 'timezone': 'UTC'}}
+        updated = await db.attendance.find_one_and_update(
+            {'employee_id': employee_id, 'tanggal': today, 'clock_in': {'$ne': None}, 'clock_out': None},
+            [{'$set': {
                 'clock_out': now.isoformat(),
-                'clock_out_foto': data.foto_url,
+                'clock_out_foto': foto,
+                'clock_out_thumb': thumbnail_url(photo_id) if photo_id else None,
                 'clock_out_latitude': data.latitude,
                 'clock_out_longitude': data.longitude,
                 'clock_out_mode': data.mode,
-                'total_jam': round(total_hours, 2)
-            }}
+                'clock_out_office': {'$literal': office_name},
+                'clock_out_distance': office_distance,
+                'clock_out_face_distance': face_distance,
+                'total_jam': {'$round': [{'$divide': [{'$subtract': [now, clock_in_date]}, 3600000]}, 2]}
+            }}],
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER
         )
-        attendance_id = attendance['id']
+        if not updated:
+            # Slow path only: work out which precondition failed
+            attendance = await db.attendance.find_one(
+                {'employee_id': employee_id, 'tanggal': today}, {'_id': 0, 'clock_in': 1}
+            )
+            if not attendance or not attendance.get('clock_in'):
+                raise HTTPException(status_code=400, detail="Anda belum clock in hari ini")
+            raise HTTPException(status_code=400, detail="Anda sudah clock out hari ini")
+    
+    if foto_content is not None:
+        try:
+            await store_photo(foto_content)
+        except Exception as e:
+            # The clock-in/out is already recorded; keep it, without a photo
+            # reference that would never resolve.
+            logger.warning("Could not store %s photo of attendance %s: %s: %s",
+                           data.tipe, updated['id'], type(e).__name__, e)
+            photo_fields = {f'{data.tipe}_foto': None, f'{data.tipe}_thumb': None}
+            await db.attendance.update_one({'id': updated['id']}, {'$set': photo_fields})
+            updated.update(photo_fields)
+            photo_id = None
     
+    if data.tipe == 'clock_in':
+        await apply_attendance_monthly(employee_id, today, {f"per_status.{stats_key(updated['status'])}": 1})
     else:
-        raise HTTPException(status_code=400, detail="Tipe tidak valid (clock_in/clock_out)")
+        await apply_attendance_monthly(employee_id, today, {'total_jam': updated.get('total_jam') or 0, 'hari_clock_out': 1})
     
-    # Return updated attendance
-    updated = await db.attendance.find_one({'id': attendance_id}, {'_id': 0})
-    return AttendanceResponse(
-        id=updated['id'],
-        employee_id=updated['employee_id'],
-        employee_nama=employee['nama_lengkap'],
-        tanggal=updated['tanggal'],
-        clock_in=updated.get('clock_in'),
-        clock_in_foto=updated.get('clock_in_foto'),
-        clock_in_latitude=updated.get('clock_in_latitude'),
-        clock_in_longitude=updated.get('clock_in_longitude'),
-        clock_in_mode=updated.get('clock_in_mode'),
-        clock_out=updated.get('clock_out'),
-        clock_out_foto=updated.get('clock_out_foto'),
-        clock_out_latitude=updated.get('clock_out_latitude'),
-        clock_out_longitude=updated.get('clock_out_longitude'),
-        clock_out_mode=updated.get('clock_out_mode'),
-        total_jam=updated.get('total_jam'),
-        status=updated['status'],
-        catatan=updated.get('catatan')
-    )
+    if photo_id:
+        schedule_thumbnail(photo_id)
+    
+    return (await build_attendance_responses([updated], {employee_id: employee['nama_lengkap']}))[0]
 
 @api_router.get("/attendance/today", response_model=Optional[AttendanceResponse])
-async def get_today_attendance(user: dict = Depends(get_current_user)):
+async def get_today_attendance(
+    include_photos: bool = False,
+    user: dict = Depends(get_current_user)
+):
     """Get today's attendance for current user"""
     if not user.get('employee_id'):
         return None
@@ -1012,46 +2048,31 @@ async def get_today_attendance(user: dict = Depends(get_current_user)):
     attendance = await db.attendance.find_one({
         'employee_id': user['employee_id'],
         'tanggal': today
-    }, {'_id': 0})
+    }, attendance_projection(include_photos))
     
     if not attendance:
         return None
     
-    employee = await db.employees.find_one({'id': user['employee_id']}, {'_id': 0})
-    
-    return AttendanceResponse(
-        id=attendance['id'],
-        employee_id=attendance['employee_id'],
-        employee_nama=employee['nama_lengkap'] if employee else None,
-        tanggal=attendance['tanggal'],
-        clock_in=attendance.get('clock_in'),
-        clock_in_foto=attendance.get('clock_in_foto'),
-        clock_in_latitude=attendance.get('clock_in_latitude'),
-        clock_in_longitude=attendance.get('clock_in_longitude'),
-        clock_in_mode=attendance.get('clock_in_mode'),
-        clock_out=attendance.get('clock_out'),
-        clock_out_foto=attendance.get('clock_out_foto'),
-        clock_out_latitude=attendance.get('clock_out_latitude'),
-        clock_out_longitude=attendance.get('clock_out_longitude'),
-        clock_out_mode=attendance.get('clock_out_mode'),
-        total_jam=attendance.get('total_jam'),
-        status=attendance['status'],
-        catatan=attendance.get('catatan')
-    )
+    return (await build_attendance_responses([attendance]))[0]
 
-@api_router.get("/attendance/history", response_model=List[AttendanceResponse])
+@api_router.get("/attendance/history", response_model=Union[AttendancePageResponse, List[AttendanceResponse]])
 async def get_attendance_history(
     employee_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    include_photos: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=ATTENDANCE_PAGE_MAX_SIZE),
+    after: Optional[str] = None,
     user: dict = Depends(get_current_user)
 ):
-    """Get attendance history"""
+    """Get attendance history, newest first; passing `limit` or `after` switches to keyset pages"""
+    paginated = limit is not None or after is not None
+    
     # If not HR/Admin, can only see own history
     if user['role'] not in ['super_admin', 'hr']:
         employee_id = user.get('employee_id')
         if not employee_id:
-            return []
+            return AttendancePageResponse(items=[]) if paginated else []
     
     query = {}
     if employee_id:
@@ -1065,32 +2086,159 @@ async def get_attendance_history(
         else:
             query['tanggal'] = {'$lte': end_date}
     
-    attendance_list = await db.attendance.find(query, {'_id': 0}).sort('tanggal', -1).to_list(100)
+    # (tanggal, id) descending is served by the (employee_id, tanggal, id) and
+    # (tanggal, id) indexes for the per-employee and company-wide shapes
+    sort = [('tanggal', -1), ('id', -1)]
+    projection = attendance_projection(include_photos)
     
-    result = []
-    for att in attendance_list:
-        employee = await db.employees.find_one({'id': att['employee_id']}, {'_id': 0})
-        result.append(AttendanceResponse(
-            id=att['id'],
-            employee_id=att['employee_id'],
-            employee_nama=employee['nama_lengkap'] if employee else None,
-            tanggal=att['tanggal'],
-            clock_in=att.get('clock_in'),
-            clock_in_foto=att.get('clock_in_foto'),
-            clock_in_latitude=att.get('clock_in_latitude'),
-            clock_in_longitude=att.get('clock_in_longitude'),
-            clock_in_mode=att.get('clock_in_mode'),
-            clock_out=att.get('clock_out'),
-            clock_out_foto=att.get('clock_out_foto'),
-            clock_out_latitude=att.get('clock_out_latitude'),
-            clock_out_longitude=att.get('clock_out_longitude'),
-            clock_out_mode=att.get('clock_out_mode'),
-            total_jam=att.get('total_jam'),
-            status=att['status'],
-            catatan=att.get('catatan')
-        ))
+    if not paginated:
+        attendance_list = await db.attendance.find(query, projection).sort(sort).to_list(100)
+        return await build_attendance_responses(attendance_list)
     
-    return result
+    page_size = limit or ATTENDANCE_PAGE_SIZE
+    if after:
+        after_tanggal, after_id = decode_cursor(after, (str, str))
+        query['$or'] = [
+            {'tanggal': {'$lt': after_tanggal}},
+            {'tanggal': after_tanggal, 'id': {'$lt': after_id}}
+        ]
+    
+    attendance_list = await db.attendance.find(query, projection).sort(sort).limit(page_size + 1).to_list(page_size + 1)
+    has_more = len(attendance_list) > page_size
+    attendance_list = attendance_list[:page_size]
+    last = attendance_list[-1] if has_more else None
+    
+    return AttendancePageResponse(
+        items=await build_attendance_responses(attendance_list),
+        next_cursor=encode_cursor([last['tanggal'], last['id']]) if last else None
+    )
+
+# `attendance_monthly` holds one rollup per employee per month. clock_attendance
+# applies $inc on every clock-in/out; rebuild_attendance_monthly() recomputes it
+# from `attendance` (startup when empty, POST /attendance/monthly/rebuild, manage.py).
+def attendance_monthly_id(employee_id: str, bulan: str) -> str:
+    return f'{employee_id}:{bulan}'
+
+async def apply_attendance_monthly(employee_id: str, tanggal: str, inc: dict):
+    bulan = tanggal[:7]
+    await db.attendance_monthly.update_one(
+        {'_id': attendance_monthly_id(employee_id, bulan)},
+        {
+            '$inc': inc,
+            '$set': {'updated_at': datetime.now(timezone.utc).isoformat()},
+            '$setOnInsert': {'employee_id': employee_id, 'bulan': bulan}
+        },
+        upsert=True
+    )
+
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+def is_valid_month(bulan: str) -> bool:
+    return bool(MONTH_PATTERN.match(bulan))
+
+def month_range(bulan: str) -> dict:
+    return {'$gte': f'{bulan}-01', '$lte': f'{bulan}-31'}
+
+async def merge_attendance_monthly(match: dict, rebuild_id: str, started: str):
+    """Aggregate `attendance` rows matching `match` into attendance_monthly
+
+    A rollup whose `updated_at` is newer than `started` received a clock in/out
+    $inc while the aggregation ran, so it is kept rather than replaced.
+    """
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {
+                'employee_id': '$employee_id',
+                'bulan': {'$substrCP': ['$tanggal', 0, 7]},
+                'status': '$status'
+            },
+            'jumlah': {'$sum': 1},
+            'total_jam': {'$sum': {'$ifNull': ['$total_jam', 0]}},
+            'hari_clock_out': {'$sum': {'$cond': [{'$ifNull': ['$clock_out', False]}, 1, 0]}}
+        }},
+        {'$group': {
+            '_id': {'employee_id': '$_id.employee_id', 'bulan': '$_id.bulan'},
+            'per_status': {'$push': {'k': '$_id.status', 'v': '$jumlah'}},
+            'total_jam': {'$sum': '$total_jam'},
+            'hari_clock_out': {'$sum': '$hari_clock_out'}
+        }},
+        {'$project': {
+            '_id': {'$concat': ['$_id.employee_id', ':', '$_id.bulan']},
+            'employee_id': '$_id.employee_id',
+            'bulan': '$_id.bulan',
+            'per_status': {'$arrayToObject': '$per_status'},
+            'total_jam': {'$round': ['$total_jam', 2]},
+            'hari_clock_out': 1,
+            'rebuild_id': rebuild_id,
+            'updated_at': started
+        }},
+        {'$merge': {
+            'into': 'attendance_monthly',
+            'whenMatched': [{'$replaceWith': {
+                '$cond': [{'$gt': ['$updated_at', '$$new.updated_at']}, '$$ROOT', '$$new']
+            }}],
+            'whenNotMatched': 'insert'
+        }}
+    ]
+    await db.attendance.aggregate(pipeline).to_list(None)
+
+async def rebuild_attendance_monthly(bulan: Optional[str] = None):
+    """Recompute monthly rollups from `attendance`, for one month (YYYY-MM) or all of them
+
+    Rollups are replaced in place by $merge, so readers never see a month
+    emptied mid-rebuild. Each rebuilt document carries this run's
+    `rebuild_id`. Rollups that a clock in/out touched during the aggregation
+    are skipped by the merge and recomputed on their own, up to
+    STATS_REBUILD_ATTEMPTS times. Afterwards, documents in scope that the run
+    did not write and that no clock in/out touched since it started (keys
+    whose attendance no longer exists) are deleted.
+
+    Like the employee stats guard, this cannot see a clock in/out whose
+    attendance write lands before the aggregation but whose $inc arrives after
+    the merge (double count); the next rebuild corrects it.
+    """
+    if bulan is not None and not is_valid_month(bulan):
+        raise ValueError(f"Invalid month {bulan!r}, expected YYYY-MM")
+    scope = {'bulan': bulan} if bulan else {}
+    rebuild_id = str(uuid.uuid4())
+    started = datetime.now(timezone.utc).isoformat()
+    
+    await merge_attendance_monthly({'tanggal': month_range(bulan)} if bulan else {}, rebuild_id, started)
+    
+    attempt_started = started
+    for attempt in range(STATS_REBUILD_ATTEMPTS + 1):
+        skipped = await db.attendance_monthly.find(
+            {**scope, 'rebuild_id': {'$ne': rebuild_id}, 'updated_at': {'$gt': attempt_started}},
+            {'employee_id': 1, 'bulan': 1}
+        ).to_list(None)
+        if not skipped:
+            break
+        if attempt == STATS_REBUILD_ATTEMPTS:
+            logger.warning("%d attendance rollups changed during every rebuild attempt; run the rebuild again",
+                           len(skipped))
+            break
+        attempt_started = datetime.now(timezone.utc).isoformat()
+        await merge_attendance_monthly(
+            {'$or': [{'employee_id': d['employee_id'], 'tanggal': month_range(d['bulan'])} for d in skipped]},
+            rebuild_id, attempt_started
+        )
+    
+    await db.attendance_monthly.delete_many({
+        **scope, 'rebuild_id': {'$ne': rebuild_id}, 'updated_at': {'$lt': started}
+    })
+    return await db.attendance_monthly.count_documents(scope)
+
+@api_router.post("/attendance/monthly/rebuild")
+async def rebuild_attendance_monthly_rollups(
+    month: Optional[str] = None,  # Format: YYYY-MM, default all months
+    user: dict = Depends(require_role(['super_admin', 'hr']))
+):
+    """Reconcile the monthly attendance rollups with the attendance collection"""
+    if month and not is_valid_month(month):
+        raise HTTPException(status_code=400, detail="Format bulan tidak valid (YYYY-MM)")
+    rollups = await rebuild_attendance_monthly(month)
+    return {"message": "Rekap absensi bulanan berhasil dihitung ulang", "jumlah_rekap": rollups}
 
 @api_router.get("/attendance/stats", response_model=AttendanceStats)
 async def get_attendance_stats(
@@ -1114,18 +2262,35 @@ async def get_attendance_stats(
     if not month:
         month = datetime.now(timezone.utc).strftime('%Y-%m')
     
-    query = {'tanggal': {'$regex': f'^{month}'}}
+    try:
+        year, mon = map(int, month.split('-'))
+        month_start = datetime(year, mon, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Format bulan tidak valid (YYYY-MM)")
+    
+    # Read the precomputed rollup: one document per employee, one $group over
+    # at most one document per employee for the company-wide view
+    bulan = month_start.strftime('%Y-%m')
     if employee_id:
-        query['employee_id'] = employee_id
-    
-    attendance_list = await db.attendance.find(query, {'_id': 0}).to_list(100)
+        rollup = await db.attendance_monthly.find_one({'_id': attendance_monthly_id(employee_id, bulan)})
+        per_status = rollup.get('per_status', {}) if rollup else {}
+    else:
+        rows = await db.attendance_monthly.aggregate([
+            {'$match': {'bulan': bulan}},
+            {'$group': {
+                '_id': None,
+                'hadir': {'$sum': '$per_status.hadir'},
+                'terlambat': {'$sum': '$per_status.terlambat'},
+                'alpha': {'$sum': '$per_status.alpha'}
+            }}
+        ]).to_list(1)
+        per_status = rows[0] if rows else {}
     
-    total_hadir = sum(1 for a in attendance_list if a['status'] == 'hadir')
-    total_terlambat = sum(1 for a in attendance_list if a['status'] == 'terlambat')
-    total_alpha = sum(1 for a in attendance_list if a['status'] == 'alpha')
+    total_hadir = per_status.get('hadir', 0)
+    total_terlambat = per_status.get('terlambat', 0)
+    total_alpha = per_status.get('alpha', 0)
     
     # Calculate working days in month (Mon-Fri)
-    year, mon = map(int, month.split('-'))
     from calendar import monthrange
     _, days_in_month = monthrange(year, mon)
     total_hari_kerja = sum(1 for d in range(1, days_in_month + 1) 
@@ -1145,6 +2310,7 @@ async def get_attendance_stats(
 @api_router.get("/attendance/team", response_model=List[AttendanceResponse])
 async def get_team_attendance(
     tanggal: Optional[str] = None,
+    include_photos: bool = False,
     user: dict = Depends(get_current_user)
 ):
     """Get team attendance for today (HR/Manager view)"""
@@ -1154,71 +2320,277 @@ async def get_team_attendance(
     if not tanggal:
         tanggal = datetime.now(timezone.utc).strftime('%Y-%m-%d')
     
-    attendance_list = await db.attendance.find({'tanggal': tanggal}, {'_id': 0}).to_list(1000)
+    attendance_list = await db.attendance.find({'tanggal': tanggal}, attendance_projection(include_photos)).to_list(1000)
+    return await build_attendance_responses(attendance_list)
+
+@api_router.get("/attendance/records/{att_id}", response_model=AttendanceResponse)
+async def get_attendance_record(att_id: str, user: dict = Depends(get_current_user)):
+    """Get a single attendance record including its photos"""
+    att = await db.attendance.find_one({'id': att_id}, {'_id': 0})
+    if not att:
+        raise HTTPException(status_code=404, detail="Data absensi tidak ditemukan")
     
-    result = []
-    for att in attendance_list:
-        employee = await db.employees.find_one({'id': att['employee_id']}, {'_id': 0})
-        result.append(AttendanceResponse(
-            id=att['id'],
-            employee_id=att['employee_id'],
-            employee_nama=employee['nama_lengkap'] if employee else None,
-            tanggal=att['tanggal'],
-            clock_in=att.get('clock_in'),
-            clock_in_foto=att.get('clock_in_foto'),
-            clock_in_latitude=att.get('clock_in_latitude'),
-            clock_in_longitude=att.get('clock_in_longitude'),
-            clock_in_mode=att.get('clock_in_mode'),
-            clock_out=att.get('clock_out'),
-            clock_out_foto=att.get('clock_out_foto'),
-            clock_out_latitude=att.get('clock_out_latitude'),
-            clock_out_longitude=att.get('clock_out_longitude'),
-            clock_out_mode=att.get('clock_out_mode'),
-            total_jam=att.get('total_jam'),
-            status=att['status'],
-            catatan=att.get('catatan')
-        ))
+    if user['role'] not in ['super_admin', 'hr', 'manager'] and att['employee_id'] != user.get('employee_id'):
+        raise HTTPException(status_code=403, detail="Akses ditolak")
     
-    return result
+    return (await build_attendance_responses([att]))[0]
 
 # ===================== FACE REGISTRATION =====================
 
+FACE_DESCRIPTOR_SIZE = 128  # face-api.js descriptor length
+FACE_DESCRIPTOR_DTYPE = np.dtype('<f4')  # stored packed: 128 x float32 = 512 bytes
+FACE_MATCH_THRESHOLD = float(os.environ.get('FACE_MATCH_THRESHOLD', '0.6'))
+FACE_VERIFICATION_REQUIRED = os.environ.get('FACE_VERIFICATION_REQUIRED', 'false').lower() == 'true'
+FACE_INDEX_SYNC_SECONDS = float(os.environ.get('FACE_INDEX_SYNC_SECONDS', '2'))
+# Templates kept per employee; registering beyond this evicts the oldest one
+FACE_MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', '5'))
+# Re-read descriptors updated this long before the newest one seen, so writes
+# committed out of timestamp order by other workers are not missed
+FACE_INDEX_SYNC_OVERLAP = timedelta(seconds=60)
+
+def valid_descriptor(values) -> bool:
+    """128 finite numbers; NaN would compare False against any threshold and pass"""
+    return len(values) == FACE_DESCRIPTOR_SIZE and bool(np.isfinite(np.asarray(values, dtype=np.float64)).all())
+
+def pack_descriptor(values) -> bytes:
+    return np.asarray(values, dtype=FACE_DESCRIPTOR_DTYPE).tobytes()
+
+def unpack_descriptor(stored) -> np.ndarray:
+    """Stored descriptor as float32 array: a read-only view over packed bytes, or a copy of a legacy list"""
+    if isinstance(stored, (bytes, bytearray, memoryview)):
+        return np.frombuffer(stored, dtype=FACE_DESCRIPTOR_DTYPE)
+    return np.asarray(stored, dtype=FACE_DESCRIPTOR_DTYPE)
+
+def unpack_templates(stored) -> np.ndarray:
+    """Stored templates as an (n, 128) matrix, oldest first; single descriptors give n = 1"""
+    return unpack_descriptor(stored).reshape(-1, FACE_DESCRIPTOR_SIZE)
+
+# face_data keeps templates in `face_templates`, an array of packed descriptors
+# (oldest first) that registration appends to atomically with $push/$slice.
+# Records written before that hold everything in `face_descriptor`.
+FACE_DATA_PROJECTION = {'_id': 0, 'employee_id': 1, 'face_templates': 1, 'face_descriptor': 1, 'updated_at': 1}
+
+def stored_templates(face: dict) -> np.ndarray:
+    """(n, 128) template matrix of a face_data document in either layout"""
+    if face.get('face_templates') is not None:
+        return unpack_templates(b''.join(face['face_templates']))
+    return unpack_templates(face['face_descriptor'])
+
+async def convert_face_templates(face: dict) -> bool:
+    """Move a legacy `face_descriptor` into `face_templates`
+
+    Guarded on the old value, so a concurrent conversion or registration in
+    between makes this a no-op instead of overwriting newer templates.
+    """
+    templates = unpack_templates(face['face_descriptor'])[-FACE_MAX_TEMPLATES:]
+    result = await db.face_data.update_one(
+        {'employee_id': face['employee_id'], 'face_templates': {'$exists': False}, 'face_descriptor': face['face_descriptor']},
+        {
+            '$set': {'face_templates': [t.tobytes() for t in templates]},
+            '$unset': {'face_descriptor': ''}
+        }
+    )
+    return result.modified_count == 1
+
+class FaceIndex:
+    """In-memory float32 template matrix (one row per face template) for 1:N identification
+
+    Loaded from `face_data` on first use; afterwards each worker pulls rows with a
+    newer `updated_at` at most once per FACE_INDEX_SYNC_SECONDS. Registrations
+    handled by this worker are applied immediately. Rows released when an
+    employee ends up with fewer templates, or is removed, are reused; until
+    then their squared norm is +inf so they never rank.
+    """
+
+    def __init__(self, dim: int, sync_seconds: float):
+        self.dim = dim
+        self.sync_seconds = sync_seconds
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+        self.owners = []  # row -> employee_id (None for free rows)
+        self.rows = {}  # employee_id -> row indices
+        self.free_rows = []
+        self.size = 0
+        self.max_templates = 1
+        self.synced_until = None
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _allocate_row(self) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.size == len(self.matrix):
+            capacity = max(1024, 2 * len(self.matrix))
+            matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            sq_norms = np.empty(capacity, dtype=np.float32)
+            sq_norms[:self.size] = self.sq_norms[:self.size]
+            self.matrix, self.sq_norms = matrix, sq_norms
+        self.owners.append(None)
+        self.size += 1
+        return self.size - 1
+
+    def _release(self, rows: List[int]) -> None:
+        for row in rows:
+            self.owners[row] = None
+            self.sq_norms[row] = np.inf
+            self.free_rows.append(row)
+
+    def upsert(self, employee_id: str, templates) -> None:
+        """Replace all templates of an employee"""
+        templates = unpack_templates(templates)
+        rows = self.rows.get(employee_id, [])
+        self._release(rows[len(templates):])
+        rows = rows[:len(templates)]
+        while len(rows) < len(templates):
+            rows.append(self._allocate_row())
+        self.matrix[rows] = templates
+        self.sq_norms[rows] = np.einsum('ij,ij->i', templates, templates)
+        for row in rows:
+            self.owners[row] = employee_id
+        self.rows[employee_id] = rows
+        self.max_templates = max(self.max_templates, len(templates))
+
+    def remove(self, employee_id: str) -> None:
+        """Drop all templates of an employee; their rows are reused by later upserts"""
+        self._release(self.rows.pop(employee_id, []))
+
+    async def sync(self) -> 'FaceIndex':
+        if self.synced_until is not None and time.monotonic() - self.checked_at < self.sync_seconds:
+            return self
+        async with self._lock:
+            if self.synced_until is not None and time.monotonic() - self.checked_at < self.sync_seconds:
+                return self
+            query = {}
+            if self.synced_until:
+                since = datetime.fromisoformat(self.synced_until) - FACE_INDEX_SYNC_OVERLAP
+                query['updated_at'] = {'$gte': since.isoformat()}
+            newest = self.synced_until or ''
+            cursor = db.face_data.find(query, FACE_DATA_PROJECTION)
+            async for face in cursor:
+                self.upsert(face['employee_id'], stored_templates(face))
+                newest = max(newest, face.get('updated_at') or '')
+            self.synced_until = newest
+            self.checked_at = time.monotonic()
+        return self
+
+    def templates(self, employee_id: str) -> Optional[np.ndarray]:
+        rows = self.rows.get(employee_id)
+        return None if not rows else self.matrix[rows]
+
+    def identify(self, descriptor, k: int) -> List[tuple]:
+        """Return up to k (employee_id, best euclidean distance) pairs, nearest first"""
+        if len(self.rows) == 0:
+            return []
+        query = np.asarray(descriptor, dtype=np.float32)
+        # |a - q|^2 = |a|^2 - 2 a.q + |q|^2, one matrix-vector product for all rows
+        sq_dist = self.sq_norms[:self.size] - 2 * (self.matrix[:self.size] @ query) + query @ query
+        # The best template of each of the k nearest employees is always among
+        # the k * max_templates nearest rows
+        candidates = min(k * self.max_templates, self.size)
+        top = np.argpartition(sq_dist, candidates - 1)[:candidates]
+        top = top[np.argsort(sq_dist[top])]
+        matches = []
+        seen = set()
+        for i in top:
+            employee_id = self.owners[i]
+            if employee_id is None or employee_id in seen:
+                continue
+            seen.add(employee_id)
+            matches.append((employee_id, float(np.sqrt(max(sq_dist[i], 0.0)))))
+            if len(matches) == k:
+                break
+        return matches
+
+    def stats(self) -> dict:
+        return {
+            'employees': len(self.rows),
+            'templates': self.size - len(self.free_rows),
+            'capacity': len(self.matrix),
+            'synced_until': self.synced_until
+        }
+
+face_index = FaceIndex(FACE_DESCRIPTOR_SIZE, FACE_INDEX_SYNC_SECONDS)
+
+async def verify_face(employee_id: str, descriptor: List[float]) -> float:
+    """Best distance between a live descriptor and the employee's templates; 400 on mismatch
+
+    Templates come from the face index, which /face/register updates in place;
+    the database is only read for an employee the index has not seen yet (e.g.
+    registered on another worker since the last sync).
+    """
+    if not valid_descriptor(descriptor):
+        raise HTTPException(status_code=400, detail="Invalid face descriptor")
+    index = await face_index.sync()
+    templates = index.templates(employee_id)
+    if templates is None:
+        face = await db.face_data.find_one({'employee_id': employee_id}, FACE_DATA_PROJECTION)
+        if not face:
+            raise HTTPException(status_code=400, detail="Wajah belum didaftarkan")
+        index.upsert(employee_id, stored_templates(face))
+        templates = index.templates(employee_id)
+    distance = float(np.linalg.norm(templates - np.asarray(descriptor, dtype=np.float32), axis=1).min())
+    if not distance <= FACE_MATCH_THRESHOLD:
+        raise HTTPException(status_code=400, detail="Wajah tidak cocok dengan data terdaftar")
+    return distance
+
+async def migrate_face_descriptors() -> int:
+    """Move legacy `face_descriptor` values (float arrays or packed blobs) into `face_templates`"""
+    migrated = 0
+    cursor = db.face_data.find(
+        {'face_templates': {'$exists': False}, 'face_descriptor': {'$exists': True}},
+        {'_id': 0, 'employee_id': 1, 'face_descriptor': 1}
+    )
+    async for face in cursor:
+        migrated += await convert_face_templates(face)
+    return migrated
+
 @api_router.post("/face/register")
 async def register_face(
     data: FaceDataCreate,
     user: dict = Depends(get_current_user)
 ):
-    """Register face descriptor for an employee"""
+    """Add a face template for an employee, evicting the oldest beyond FACE_MAX_TEMPLATES"""
     if not user.get('employee_id'):
         raise HTTPException(status_code=400, detail="Akun tidak terhubung dengan data karyawan")
     
     employee_id = user['employee_id']
     
-    # Validate face descriptor length (should be 128 for face-api.js)
-    if len(data.face_descriptor) != 128:
+    # 128 finite values, as produced by face-api.js
+    if not valid_descriptor(data.face_descriptor):
         raise HTTPException(status_code=400, detail="Invalid face descriptor")
     
-    # Save or update face data
-    existing = await db.face_data.find_one({'employee_id': employee_id})
-    
-    if existing:
-        await db.face_data.update_one(
-            {'employee_id': employee_id},
-            {'$set': {
-                'face_descriptor': data.face_descriptor,
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            }}
-        )
+    # A legacy record is converted first so $push appends to its existing templates
+    legacy = await db.face_data.find_one(
+        {'employee_id': employee_id, 'face_templates': {'$exists': False}, 'face_descriptor': {'$exists': True}},
+        {'_id': 0, 'employee_id': 1, 'face_descriptor': 1}
+    )
+    if legacy and not data.reset:
+        await convert_face_templates(legacy)
+    
+    # One atomic append-and-trim, so concurrent registrations never drop each other's templates
+    packed = pack_descriptor(data.face_descriptor)
+    now = datetime.now(timezone.utc).isoformat()
+    if data.reset:
+        update = {'$set': {'face_templates': [packed], 'updated_at': now}}
     else:
-        await db.face_data.insert_one({
-            'id': str(uuid.uuid4()),
-            'employee_id': employee_id,
-            'face_descriptor': data.face_descriptor,
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        })
+        update = {
+            '$push': {'face_templates': {'$each': [packed], '$slice': -FACE_MAX_TEMPLATES}},
+            '$set': {'updated_at': now}
+        }
+    update['$unset'] = {'face_descriptor': ''}
+    update['$setOnInsert'] = {'id': str(uuid.uuid4()), 'created_at': now}
+    face = await db.face_data.find_one_and_update(
+        {'employee_id': employee_id},
+        update,
+        projection=FACE_DATA_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    templates = stored_templates(face)
+    face_index.upsert(employee_id, templates)
     
-    return {"message": "Wajah berhasil didaftarkan"}
+    return {"message": "Wajah berhasil didaftarkan", "jumlah_template": len(templates)}
 
 @api_router.get("/face/check")
 async def check_face_registered(user: dict = Depends(get_current_user)):
@@ -1230,16 +2602,58 @@ async def check_face_registered(user: dict = Depends(get_current_user)):
     return {"registered": face_data is not None}
 
 @api_router.get("/face/descriptor")
-async def get_face_descriptor(user: dict = Depends(get_current_user)):
+async def get_face_descriptor(
+    format: str = 'json',  # json: list of floats, base64: packed little-endian float32
+    user: dict = Depends(get_current_user)
+):
     """Get user's face descriptor for verification"""
     if not user.get('employee_id'):
         raise HTTPException(status_code=400, detail="Akun tidak terhubung dengan data karyawan")
+    if format not in ['json', 'base64']:
+        raise HTTPException(status_code=400, detail="Format tidak valid (json/base64)")
     
-    face_data = await db.face_data.find_one({'employee_id': user['employee_id']}, {'_id': 0})
+    face_data = await db.face_data.find_one({'employee_id': user['employee_id']}, FACE_DATA_PROJECTION)
     if not face_data:
         raise HTTPException(status_code=404, detail="Wajah belum didaftarkan")
     
-    return {"face_descriptor": face_data['face_descriptor']}
+    # Newest template; clients doing local 1:1 matching only need one
+    templates = stored_templates(face_data)
+    descriptor = templates[-1]
+    if format == 'base64':
+        return {
+            "face_descriptor": base64.b64encode(descriptor.tobytes()).decode('ascii'),
+            "encoding": "float32-le",
+            "jumlah_template": len(templates)
+        }
+    return {"face_descriptor": descriptor.tolist(), "jumlah_template": len(templates)}
+
+@api_router.post("/face/identify")
+async def identify_face(
+    data: FaceIdentifyRequest,
+    user: dict = Depends(require_role(['super_admin', 'hr', 'manager']))
+):
+    """Identify who a face descriptor belongs to among all registered employees (kiosk mode)"""
+    if not valid_descriptor(data.face_descriptor):
+        raise HTTPException(status_code=400, detail="Invalid face descriptor")
+    
+    started = time.perf_counter()
+    index = await face_index.sync()
+    # Over-fetch a little: employees deleted after registering are dropped below
+    candidates = index.identify(data.face_descriptor, data.k + 5)
+    took_ms = (time.perf_counter() - started) * 1000
+    
+    names = await fetch_names(db.employees, (employee_id for employee_id, _ in candidates), 'nama_lengkap')
+    matches = [
+        {
+            'employee_id': employee_id,
+            'nama_lengkap': names[employee_id],
+            'distance': round(distance, 4),
+            'match': distance <= FACE_MATCH_THRESHOLD
+        }
+        for employee_id, distance in candidates
+        if employee_id in names
+    ][:data.k]
+    return {"matches": matches, "threshold": FACE_MATCH_THRESHOLD, "took_ms": round(took_ms, 2)}
 
 # ===================== LEAVE MANAGEMENT MODELS =====================
 
@@ -1876,6 +3290,7 @@ async def create_shift(
     user: dict = Depends(require_role(['super_admin', 'hr']))
 ):
     """Create a new shift"""
+    validate_clock_times(data.jam_masuk, data.jam_keluar)
     shift_id = str(uuid.uuid4())
     shift_doc = {
         'id': shift_id,
@@ -1910,6 +3325,7 @@ async def update_shift(
     user: dict = Depends(require_role(['super_admin', 'hr']))
 ):
     """Update a shift"""
+    validate_clock_times(data.jam_masuk, data.jam_keluar)
     shift = await db.shifts.find_one({'id': shift_id})
     if not shift:
         raise HTTPException(status_code=404, detail="Shift tidak ditemukan")
@@ -1924,6 +3340,8 @@ async def update_shift(
         }}
     )
     
+    await bump_settings_version('schedule_version')
+    
     updated = await db.shifts.find_one({'id': shift_id}, {'_id': 0})
     return ShiftResponse(**updated)
 
@@ -1972,6 +3390,7 @@ async def assign_shift(
     }
     
     await db.shift_assignments.insert_one(assignment_doc)
+    await bump_settings_version('schedule_version')
     
     return ShiftAssignmentResponse(
         id=assignment_id,
@@ -2077,7 +3496,7 @@ async def seed_data():
         'id': admin_id,
         'email': 'admin@haergo.com',
         'nama_lengkap': 'Super Admin',
-        'password': hash_password('admin123'),
+        'password': await hash_password_async('admin123'),
         'role': 'super_admin',
         'employee_id': None,
         'created_at': datetime.now(timezone.utc).isoformat()
@@ -2089,7 +3508,7 @@ async def seed_data():
         'id': hr_id,
         'email': 'hr@haergo.com',
         'nama_lengkap': 'HR Manager',
-        'password': hash_password('hr123'),
+        'password': await hash_password_async('hr123'),
         'role': 'hr',
         'employee_id': None,
         'created_at': datetime.now(timezone.utc).isoformat()
@@ -2166,7 +3585,7 @@ async def seed_data():
     
     for i, e in enumerate(employees_data):
         emp_id = str(uuid.uuid4())
-        await db.employees.insert_one({
+        emp_doc = {
             'id': emp_id,
             'nik': e['nik'],
             'nama_lengkap': e['nama'],
@@ -2182,10 +3601,162 @@ async def seed_data():
             'foto_url': avatars[i % len(avatars)],
             'user_id': None,
             'created_at': datetime.now(timezone.utc).isoformat()
-        })
+        }
+        emp_doc['search_terms'] = employee_search_terms(emp_doc)
+        await db.employees.insert_one(emp_doc)
+    
+    await rebuild_employee_stats()
     
     return {"message": "Data berhasil dibuat", "admin_email": "admin@haergo.com", "admin_password": "admin123"}
 
+# ===================== INDEXES =====================
+
+# (collection, keys, options). Names follow MongoDB's default `field_direction`
+# scheme so indexes created by hand are recognised as already present.
+INDEXES = [
+    ('users', [('id', 1)], {'unique': True}),
+    ('users', [('email', 1)], {'unique': True}),
+    ('employees', [('id', 1)], {'unique': True}),
+    ('employees', [('nik', 1)], {'unique': True}),
+    ('employees', [('email', 1)], {'unique': True}),
+    ('employees', [('department_id', 1), ('nik', 1)], {}),
+    ('employees', [('status', 1), ('nik', 1)], {}),
+    ('employees', [('search_terms', 1)], {}),
+    ('departments', [('id', 1)], {'unique': True}),
+    ('departments', [('kode', 1)], {'unique': True}),
+    ('positions', [('id', 1)], {'unique': True}),
+    ('positions', [('department_id', 1)], {}),
+    ('attendance', [('id', 1)], {'unique': True}),
+    ('attendance', [('employee_id', 1), ('tanggal', 1)], {'unique': True}),
+    ('attendance', [('employee_id', 1), ('tanggal', -1), ('id', -1)], {}),
+    ('attendance', [('tanggal', -1), ('id', -1)], {}),
+    ('attendance_monthly', [('bulan', 1)], {}),
+    ('photos.files', [('filename', 1)], {'unique': True}),
+    ('offices', [('id', 1)], {'unique': True}),
+    ('face_data', [('employee_id', 1)], {'unique': True}),
+    ('face_data', [('updated_at', 1)], {}),
+    ('leave_requests', [('id', 1)], {'unique': True}),
+    ('leave_requests', [('status', 1), ('created_at', -1)], {}),
+    ('leave_requests', [('employee_id', 1), ('created_at', -1)], {}),
+    ('leave_requests', [('employee_id', 1), ('tipe_cuti', 1), ('status', 1)], {}),
+    ('leave_requests', [('status', 1), ('tanggal_mulai', 1)], {}),
+    ('overtime_requests', [('id', 1)], {'unique': True}),
+    ('overtime_requests', [('status', 1), ('created_at', -1)], {}),
+    ('overtime_requests', [('employee_id', 1), ('created_at', -1)], {}),
+    ('overtime_requests', [('status', 1), ('tanggal', 1)], {}),
+    ('shifts', [('id', 1)], {'unique': True}),
+    ('shift_assignments', [('id', 1)], {'unique': True}),
+    ('shift_assignments', [('employee_id', 1)], {}),
+    ('shift_assignments', [('shift_id', 1)], {}),
+]
+
+# startup: build missing indexes before serving, background: build them in a task
+# after startup, off: leave it to `python manage.py ensure-indexes`
+INDEX_BUILD_MODE = os.environ.get('INDEX_BUILD_MODE', 'startup')
+
+def index_name(keys: list) -> str:
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+# Indexes the application cannot run without: clock-in relies on the unique
+# (employee_id, tanggal) index to reject a second record for the same day.
+REQUIRED_INDEXES = [
+    ('attendance', 'employee_id_1_tanggal_1'),
+]
+
+async def ensure_indexes(background: bool = False, only: Optional[List[tuple]] = None) -> List[str]:
+    """Create any missing indexes and return the `collection.name` of each one built
+
+    `only` restricts the run to the given (collection, name) pairs.
+    """
+    built = []
+    existing = {}
+    for collection, keys, options in INDEXES:
+        if only is not None and (collection, index_name(keys)) not in only:
+            continue
+        if collection not in existing:
+            existing[collection] = await db[collection].index_information()
+        name = index_name(keys)
+        if name in existing[collection]:
+            continue
+        started = time.perf_counter()
+        try:
+            await db[collection].create_index(keys, name=name, background=background, **options)
+        except OperationFailure as e:
+            logger.warning("Could not create index %s.%s: %s", collection, name, e)
+            continue
+        logger.info("Created index %s.%s in %.1fs", collection, name, time.perf_counter() - started)
+        built.append(f'{collection}.{name}')
+    return built
+
+async def missing_required_indexes() -> List[str]:
+    """`collection.name` of each REQUIRED_INDEXES entry that does not exist (or is not unique)"""
+    missing = []
+    for collection, name in REQUIRED_INDEXES:
+        info = (await db[collection].index_information()).get(name)
+        if not info or not info.get('unique'):
+            missing.append(f'{collection}.{name}')
+    return missing
+
+async def dedupe_attendance() -> int:
+    """Delete duplicate (employee_id, tanggal) attendance records so the unique index can be built
+
+    Of each duplicated day the most complete record is kept: one with a
+    clock_out first, then the earliest clock_in. Monthly rollups of the
+    affected months are rebuilt. Returns the number of records deleted.
+    """
+    duplicates = db.attendance.aggregate([
+        {'$group': {
+            '_id': {'employee_id': '$employee_id', 'tanggal': '$tanggal'},
+            'records': {'$push': {'_id': '$_id', 'clock_in': '$clock_in', 'clock_out': '$clock_out'}},
+            'jumlah': {'$sum': 1}
+        }},
+        {'$match': {'jumlah': {'$gt': 1}}}
+    ], allowDiskUse=True)
+    deleted = 0
+    months = set()
+    async for group in duplicates:
+        records = sorted(
+            group['records'],
+            key=lambda r: (r.get('clock_out') is None, r.get('clock_in') is None, r.get('clock_in') or '')
+        )
+        result = await db.attendance.delete_many({'_id': {'$in': [r['_id'] for r in records[1:]]}})
+        deleted += result.deleted_count
+        months.add(group['_id']['tanggal'][:7])
+    for bulan in sorted(months):
+        await rebuild_attendance_monthly(bulan)
+    return deleted
+
+async def dedupe_photos() -> int:
+    """Delete duplicate GridFS photo files (same content hash) so the unique filename index can be built
+
+    Attendance records reference photos by content hash, so any copy can go.
+    Returns the number of files deleted.
+    """
+    duplicates = db[f'{PHOTO_BUCKET}.files'].aggregate([
+        {'$group': {'_id': '$filename', 'ids': {'$push': '$_id'}, 'jumlah': {'$sum': 1}}},
+        {'$match': {'jumlah': {'$gt': 1}}}
+    ], allowDiskUse=True)
+    deleted = 0
+    bucket = photo_bucket()
+    async for group in duplicates:
+        for file_id in sorted(group['ids'])[1:]:
+            await bucket.delete(file_id)
+            deleted += 1
+    return deleted
+
+# ===================== SYSTEM =====================
+
+@api_router.get("/system/metrics")
+async def get_system_metrics(user: dict = Depends(require_role(['super_admin']))):
+    """Get in-process cache and worker metrics for this worker"""
+    return {
+        "pid": os.getpid(),
+        "user_cache": user_cache.stats(),
+        "password_executor": password_executor_stats(),
+        "attendance_settings": attendance_settings.stats(),
+        "face_index": face_index.stats()
+    }
+
 # ===================== ROOT =====================
 
 @api_router.get("/")
@@ -2201,6 +3772,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -2210,6 +3782,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_database_indexes():
+    if INDEX_BUILD_MODE == 'startup':
+        built = await ensure_indexes()
+        logger.info("Index check complete: %d built", len(built))
+    elif INDEX_BUILD_MODE == 'background':
+        # Required indexes are built before serving; everything else in a task
+        await ensure_indexes(only=REQUIRED_INDEXES)
+        app.state.index_build = asyncio.create_task(ensure_indexes(background=True))
+    missing = await missing_required_indexes()
+    if missing:
+        raise RuntimeError(
+            f"Required index(es) missing: {', '.join(missing)}. "
+            "Run `python manage.py ensure-indexes` (it removes duplicate attendance records first)."
+        )
+
+@app.on_event("startup")
+async def ensure_attendance_settings():
+    await seed_attendance_settings()
+
+@app.on_event("startup")
+async def load_face_index():
+    stats = (await face_index.sync()).stats()
+    logger.info("Face index loaded: %d templates for %d employees", stats['templates'], stats['employees'])
+
+@app.on_event("startup")
+async def ensure_materialized_stats():
+    if not employee_stats_ready(await db.stats.find_one({'_id': STATS_EMPLOYEES_ID}, {'rebuilt_at': 1})):
+        stats_doc = await rebuild_employee_stats()
+        logger.info("Rebuilt employee stats: %d employees", stats_doc['total'])
+
+async def backfill_search_terms_in_background():
+    try:
+        updated = await backfill_employee_search_terms()
+        logger.info("Search terms backfilled: %d employees", updated)
+    except Exception:
+        logger.exception("Search terms backfill failed; run `python manage.py backfill-search`")
+
+@app.on_event("startup")
+async def ensure_employee_search_terms():
+    # Employees from before search indexing; backfilled without delaying startup
+    if await db.employees.find_one({'search_terms': {'$exists': False}}, {'_id': 1}):
+        app.state.search_backfill = asyncio.create_task(backfill_search_terms_in_background())
+
+@app.on_event("startup")
+async def ensure_attendance_monthly():
+    if await db.attendance_monthly.find_one({}, {'_id': 1}) is None and await db.attendance.find_one({}, {'_id': 1}):
+        rollups = await rebuild_attendance_monthly()
+        logger.info("Rebuilt attendance monthly rollups: %d documents", rollups)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    password_executor.shutdown(wait=False)
+    shutdown_thumbnail_executor()
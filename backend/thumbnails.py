@@ -0,0 +1,21 @@
+"""Thumbnail rendering for attendance selfies.
+
+Kept apart from server.py so the worker processes of the thumbnail pool,
+which are started with the `spawn` method, only import Pillow and not the
+whole application.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+# Pillow raises these for corrupt, truncated, unsupported or oversized images
+THUMBNAIL_ERRORS = (OSError, ValueError, SyntaxError, EOFError, Image.DecompressionBombError)
+
+def make_thumbnail(content: bytes, size: int) -> bytes:
+    """Decode, orient, shrink and re-encode an image as JPEG (runs in a worker process)"""
+    with Image.open(io.BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=80, optimize=True)
+        return out.getvalue()
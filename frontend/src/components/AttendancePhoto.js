@@ -0,0 +1,71 @@
+import React, { useEffect, useState } from 'react';
+import { api } from '../context/AuthContext';
+
+const PHOTO_PREFIX = '/api/';
+
+// Stored photos ("/api/photos/<id>") require the auth header, which <img> and
+// <a href> cannot send, so they are fetched through the api client as blobs.
+const fetchPhoto = async (src) => {
+  const response = await api.get(src.slice(PHOTO_PREFIX.length - 1), { responseType: 'blob' });
+  return URL.createObjectURL(response.data);
+};
+
+const isStoredPhoto = (src) => Boolean(src && src.startsWith(PHOTO_PREFIX));
+
+const AttendancePhoto = ({ src, fullSrc, alt, className }) => {
+  const [objectUrl, setObjectUrl] = useState(null);
+
+  useEffect(() => {
+    if (!isStoredPhoto(src)) {
+      setObjectUrl(null);
+      return undefined;
+    }
+    let cancelled = false;
+    let created = null;
+    fetchPhoto(src)
+      .then((url) => {
+        created = url;
+        if (cancelled) {
+          URL.revokeObjectURL(url);
+        } else {
+          setObjectUrl(url);
+        }
+      })
+      .catch(() => setObjectUrl(null));
+    return () => {
+      cancelled = true;
+      if (created) URL.revokeObjectURL(created);
+    };
+  }, [src]);
+
+  const openFull = async (event) => {
+    event.preventDefault();
+    const target = fullSrc || src;
+    if (!isStoredPhoto(target)) {
+      window.open(target, '_blank', 'noreferrer');
+      return;
+    }
+    // Open the tab synchronously so popup blockers allow it, then point it at the blob
+    const tab = window.open('', '_blank');
+    try {
+      const url = await fetchPhoto(target);
+      if (tab) tab.location.href = url;
+    } catch (error) {
+      if (tab) tab.close();
+    }
+  };
+
+  const imageSrc = isStoredPhoto(src) ? objectUrl : src;
+
+  return (
+    <a href={fullSrc || src} onClick={openFull} rel="noreferrer">
+      {imageSrc ? (
+        <img src={imageSrc} alt={alt} className={className} />
+      ) : (
+        <div className={`${className} aspect-[4/3] bg-slate-100 animate-pulse`} />
+      )}
+    </a>
+  );
+};
+
+export default AttendancePhoto;
@@ -47,6 +47,7 @@ import {
 } from 'lucide-react';
 import { format } from 'date-fns';
 import { id } from 'date-fns/locale';
+import AttendancePhoto from '../components/AttendancePhoto';
 
 const statusConfig = {
   hadir: { label: 'Hadir', color: 'bg-green-100 text-green-700', icon: CheckCircle },
@@ -135,9 +136,16 @@ const AttendanceHistoryPage = () => {
     });
   };
 
-  const openDetail = (attendance) => {
+  const openDetail = async (attendance) => {
     setSelectedAttendance(attendance);
     setShowDetailDialog(true);
+    // List responses omit photos; load them for the selected record only
+    try {
+      const response = await api.get(`/attendance/records/${attendance.id}`);
+      setSelectedAttendance(response.data);
+    } catch (error) {
+      console.error('Failed to fetch attendance detail:', error);
+    }
   };
 
   // Generate month options for the last 12 months
@@ -394,9 +402,10 @@ const AttendanceHistoryPage = () => {
                       </p>
                     )}
                   </div>
-                  {selectedAttendance.clock_in_foto && (
-                    <img
-                      src={selectedAttendance.clock_in_foto}
+                  {(selectedAttendance.clock_in_thumb || selectedAttendance.clock_in_foto) && (
+                    <AttendancePhoto
+                      src={selectedAttendance.clock_in_thumb || selectedAttendance.clock_in_foto}
+                      fullSrc={selectedAttendance.clock_in_foto || selectedAttendance.clock_in_thumb}
                       alt="Clock In"
                       className="w-full rounded-lg"
                     />
@@ -416,9 +425,10 @@ const AttendanceHistoryPage = () => {
                       </p>
                     )}
                   </div>
-                  {selectedAttendance.clock_out_foto && (
-                    <img
-                      src={selectedAttendance.clock_out_foto}
+                  {(selectedAttendance.clock_out_thumb || selectedAttendance.clock_out_foto) && (
+                    <AttendancePhoto
+                      src={selectedAttendance.clock_out_thumb || selectedAttendance.clock_out_foto}
+                      fullSrc={selectedAttendance.clock_out_foto || selectedAttendance.clock_out_thumb}
                       alt="Clock Out"
                       className="w-full rounded-lg"
                     />
@@ -41,6 +41,8 @@ const statusColors = {
   resign: 'bg-red-100 text-red-700',
 };
 
+const PAGE_SIZE = 50;
+
 const EmployeesPage = () => {
   const navigate = useNavigate();
   const { isHR } = useAuth();
@@ -48,7 +50,10 @@ const EmployeesPage = () => {
   const [departments, setDepartments] = useState([]);
   const [positions, setPositions] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [search, setSearch] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
   const [filterDept, setFilterDept] = useState('all');
   const [filterStatus, setFilterStatus] = useState('all');
   const [showAddDialog, setShowAddDialog] = useState(false);
@@ -72,19 +77,48 @@ const EmployeesPage = () => {
   });
 
   useEffect(() => {
-    fetchData();
+    const loadOptions = async () => {
+      try {
+        const [deptRes, posRes] = await Promise.all([
+          api.get('/departments'),
+          api.get('/positions'),
+        ]);
+        setDepartments(deptRes.data);
+        setPositions(posRes.data);
+      } catch (error) {
+        toast.error('Gagal memuat data');
+      }
+    };
+    loadOptions();
   }, []);
 
+  // Wait for typing to pause before querying the server
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(search.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  useEffect(() => {
+    fetchData();
+  }, [debouncedSearch, filterDept, filterStatus]);
+
+  // Filtering and search run on the server; pages come back in NIK order and
+  // next_cursor (null on the last page, and always for search) fetches the next one
+  const fetchEmployees = async (after = null) => {
+    const params = { limit: PAGE_SIZE };
+    if (after) params.after = after;
+    if (debouncedSearch) params.search = debouncedSearch;
+    if (filterDept !== 'all') params.department_id = filterDept;
+    if (filterStatus !== 'all') params.status = filterStatus;
+    const response = await api.get('/employees', { params });
+    return response.data;
+  };
+
   const fetchData = async () => {
     try {
-      const [empRes, deptRes, posRes] = await Promise.all([
-        api.get('/employees'),
-        api.get('/departments'),
-        api.get('/positions'),
-      ]);
-      setEmployees(empRes.data);
-      setDepartments(deptRes.data);
-      setPositions(posRes.data);
+      const page = await fetchEmployees();
+      setEmployees(page.items);
+      setNextCursor(page.next_cursor);
     } catch (error) {
       toast.error('Gagal memuat data');
     } finally {
@@ -92,15 +126,19 @@ const EmployeesPage = () => {
     }
   };
 
-  const filteredEmployees = employees.filter((emp) => {
-    const matchSearch =
-      emp.nama_lengkap.toLowerCase().includes(search.toLowerCase()) ||
-      emp.nik.toLowerCase().includes(search.toLowerCase()) ||
-      emp.email.toLowerCase().includes(search.toLowerCase());
-    const matchDept = filterDept === 'all' || emp.department_id === filterDept;
-    const matchStatus = filterStatus === 'all' || emp.status === filterStatus;
-    return matchSearch && matchDept && matchStatus;
-  });
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchEmployees(nextCursor);
+      setEmployees((current) => [...current, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      toast.error('Gagal memuat data');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -276,7 +314,7 @@ const EmployeesPage = () => {
                 </TableRow>
               </TableHeader>
               <TableBody>
-                {filteredEmployees.length === 0 ? (
+                {employees.length === 0 ? (
                   <TableRow>
                     <TableCell colSpan={6} className="text-center py-12">
                       <Users className="w-12 h-12 mx-auto text-muted-foreground/50 mb-3" />
@@ -284,7 +322,7 @@ const EmployeesPage = () => {
                     </TableCell>
                   </TableRow>
                 ) : (
-                  filteredEmployees.map((emp) => (
+                  employees.map((emp) => (
                     <TableRow key={emp.id} data-testid={`employee-row-${emp.nik}`}>
                       <TableCell>
                         <div className="flex items-center gap-3">
@@ -350,6 +388,20 @@ const EmployeesPage = () => {
               </TableBody>
             </Table>
           </div>
+          {nextCursor && (
+            <div className="flex justify-center p-4 border-t">
+              <Button
+                variant="outline"
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="gap-2"
+                data-testid="load-more-employees"
+              >
+                {loadingMore && <Loader2 className="w-4 h-4 animate-spin" />}
+                Muat lebih banyak
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
 
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+TEST_MONGO_URL = os.environ.get('TEST_MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('MONGO_URL', TEST_MONGO_URL)
+os.environ.setdefault('DB_NAME', 'haergo_test')
+
+import server  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+
+@pytest.fixture
+def mongo():
+    """Point `server.db` at a scratch database and return a coroutine runner
+
+    Skips the test when no MongoDB server is reachable at TEST_MONGO_URL.
+    """
+    loop = asyncio.new_event_loop()
+    client = AsyncIOMotorClient(TEST_MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        loop.run_until_complete(client.admin.command('ping'))
+    except Exception:
+        client.close()
+        loop.close()
+        pytest.skip(f"MongoDB not reachable at {TEST_MONGO_URL}")
+
+    db_name = f"haergo_test_{uuid.uuid4().hex[:8]}"
+    original = server.client, server.db
+    server.client, server.db = client, client[db_name]
+    server.user_cache.clear()
+    server.attendance_settings.__init__(server.SETTINGS_CHECK_SECONDS)
+    yield loop.run_until_complete
+    loop.run_until_complete(client.drop_database(db_name))
+    server.client, server.db = original
+    client.close()
+    loop.close()
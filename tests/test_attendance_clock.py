@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+EMPLOYEE_USER = {'id': 'user-1', 'email': 'budi@haergo.com', 'role': 'employee', 'employee_id': 'emp-1'}
+
+
+def clock(tipe: str) -> server.AttendanceCreate:
+    return server.AttendanceCreate(
+        tipe=tipe, mode='wfh', latitude=-6.2, longitude=106.8,
+        foto_url='https://example.com/selfie.jpg'
+    )
+
+
+async def seed_employee():
+    await server.ensure_indexes()
+    await server.db.employees.insert_one({'id': 'emp-1', 'nik': 'EMP001', 'nama_lengkap': 'Budi', 'status': 'aktif'})
+
+
+def test_second_clock_in_same_day_is_rejected(mongo):
+    async def scenario():
+        await seed_employee()
+        await server.clock_attendance(clock('clock_in'), user=EMPLOYEE_USER)
+        with pytest.raises(HTTPException) as exc:
+            await server.clock_attendance(clock('clock_in'), user=EMPLOYEE_USER)
+        assert exc.value.status_code == 400
+        assert await server.db.attendance.count_documents({'employee_id': 'emp-1'}) == 1
+
+    mongo(scenario())
+
+
+def test_concurrent_clock_ins_create_one_record(mongo):
+    async def scenario():
+        await seed_employee()
+        results = await asyncio.gather(
+            *(server.clock_attendance(clock('clock_in'), user=EMPLOYEE_USER) for _ in range(5)),
+            return_exceptions=True
+        )
+        assert sum(not isinstance(r, Exception) for r in results) == 1
+        assert all(isinstance(r, HTTPException) and r.status_code == 400 for r in results if isinstance(r, Exception))
+        assert await server.db.attendance.count_documents({'employee_id': 'emp-1'}) == 1
+
+    mongo(scenario())
+
+
+def test_clock_in_after_completed_day_is_rejected(mongo):
+    async def scenario():
+        await seed_employee()
+        await server.clock_attendance(clock('clock_in'), user=EMPLOYEE_USER)
+        await server.clock_attendance(clock('clock_out'), user=EMPLOYEE_USER)
+        with pytest.raises(HTTPException) as exc:
+            await server.clock_attendance(clock('clock_in'), user=EMPLOYEE_USER)
+        assert exc.value.detail == "Anda sudah clock in hari ini"
+        assert await server.db.attendance.count_documents({'employee_id': 'emp-1'}) == 1
+
+    mongo(scenario())
+
+
+def test_dedupe_keeps_most_complete_record_and_allows_unique_index(mongo):
+    async def scenario():
+        await server.db.attendance.insert_many([
+            {'id': 'a', 'employee_id': 'emp-1', 'tanggal': '2025-01-22', 'clock_in': '2025-01-22T02:00:00+00:00', 'clock_out': None, 'status': 'hadir'},
+            {'id': 'b', 'employee_id': 'emp-1', 'tanggal': '2025-01-22', 'clock_in': '2025-01-22T02:05:00+00:00', 'clock_out': '2025-01-22T10:00:00+00:00', 'status': 'hadir'},
+            {'id': 'c', 'employee_id': 'emp-2', 'tanggal': '2025-01-22', 'clock_in': '2025-01-22T02:00:00+00:00', 'clock_out': None, 'status': 'hadir'},
+        ])
+        assert await server.missing_required_indexes() == ['attendance.employee_id_1_tanggal_1']
+
+        assert await server.dedupe_attendance() == 1
+        remaining = await server.db.attendance.find({}, {'_id': 0, 'id': 1}).sort('id', 1).to_list(None)
+        assert [r['id'] for r in remaining] == ['b', 'c']
+
+        await server.ensure_indexes()
+        assert await server.missing_required_indexes() == []
+
+    mongo(scenario())
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from typer.testing import CliRunner
+
+import manage
+import server
+
+
+@pytest.mark.parametrize('month', ['2025-1', '2025-13', '2025-00', '25-01', '2025-01-01', '2025-01; x'])
+def test_invalid_month_is_rejected(month):
+    assert not server.is_valid_month(month)
+    with pytest.raises(ValueError):
+        asyncio.run(server.rebuild_attendance_monthly(month))
+
+    result = CliRunner().invoke(manage.cli, ['rebuild-attendance-monthly', '--month', month])
+    assert result.exit_code == 2
+    assert 'YYYY-MM' in result.output
+
+
+def record(id: str, employee_id: str, tanggal: str, status: str = 'hadir', total_jam=None) -> dict:
+    return {'id': id, 'employee_id': employee_id, 'tanggal': tanggal, 'status': status,
+            'clock_in': f'{tanggal}T01:00:00+00:00', 'clock_out': f'{tanggal}T09:00:00+00:00' if total_jam else None,
+            'total_jam': total_jam}
+
+
+def test_rebuild_replaces_in_place_and_drops_stale_keys(mongo):
+    async def scenario():
+        await server.db.attendance.insert_many([
+            record('a', 'emp-1', '2025-01-02', total_jam=8),
+            record('b', 'emp-1', '2025-01-03', status='terlambat'),
+            record('c', 'emp-1', '2025-02-03', total_jam=7.5),
+        ])
+        await server.db.attendance_monthly.insert_many([
+            # Wrong counters for a key that still exists
+            {'_id': 'emp-1:2025-01', 'employee_id': 'emp-1', 'bulan': '2025-01', 'per_status': {'hadir': 9},
+             'total_jam': 99, 'hari_clock_out': 9, 'updated_at': '2025-01-31T00:00:00+00:00'},
+            # An employee whose January attendance was deleted
+            {'_id': 'emp-2:2025-01', 'employee_id': 'emp-2', 'bulan': '2025-01', 'per_status': {'hadir': 1},
+             'total_jam': 8, 'hari_clock_out': 1, 'updated_at': '2025-01-31T00:00:00+00:00'},
+            # Out of scope for a January rebuild
+            {'_id': 'emp-3:2024-12', 'employee_id': 'emp-3', 'bulan': '2024-12', 'per_status': {'hadir': 1},
+             'total_jam': 8, 'hari_clock_out': 1, 'updated_at': '2024-12-31T00:00:00+00:00'},
+        ])
+
+        assert await server.rebuild_attendance_monthly('2025-01') == 1
+        january = await server.db.attendance_monthly.find_one({'_id': 'emp-1:2025-01'})
+        assert january['per_status'] == {'hadir': 1, 'terlambat': 1}
+        assert january['total_jam'] == 8
+        assert january['hari_clock_out'] == 1
+        assert await server.db.attendance_monthly.find_one({'_id': 'emp-2:2025-01'}) is None
+        assert await server.db.attendance_monthly.find_one({'_id': 'emp-3:2024-12'}) is not None
+        assert await server.db.attendance_monthly.find_one({'_id': 'emp-1:2025-02'}) is None
+
+        await server.rebuild_attendance_monthly()
+        ids = sorted(d['_id'] for d in await server.db.attendance_monthly.find({}, {'_id': 1}).to_list(None))
+        assert ids == ['emp-1:2025-01', 'emp-1:2025-02']
+
+    mongo(scenario())
+
+
+def test_rebuild_does_not_overwrite_a_clock_in_applied_meanwhile(mongo, monkeypatch):
+    async def scenario():
+        await server.db.attendance.insert_one(record('a', 'emp-1', '2025-01-02', total_jam=8))
+        await server.rebuild_attendance_monthly('2025-01')
+
+        merge = server.merge_attendance_monthly
+        calls = []
+
+        async def merge_with_concurrent_clock_in(match, rebuild_id, started):
+            if not calls:
+                # A clock-in lands after the rebuild started
+                await server.db.attendance.insert_one(record('b', 'emp-1', '2025-01-03', status='terlambat'))
+                await server.apply_attendance_monthly('emp-1', '2025-01-03', {'per_status.terlambat': 1})
+            calls.append(match)
+            await merge(match, rebuild_id, started)
+
+        monkeypatch.setattr(server, 'merge_attendance_monthly', merge_with_concurrent_clock_in)
+        await server.rebuild_attendance_monthly('2025-01')
+
+        assert len(calls) == 2  # the touched rollup was recomputed on its own
+        january = await server.db.attendance_monthly.find_one({'_id': 'emp-1:2025-01'})
+        assert january['per_status'] == {'hadir': 1, 'terlambat': 1}
+        assert january['total_jam'] == 8
+
+    mongo(scenario())
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import benchmark
+import server
+
+
+def test_measure_reports_median_and_p95():
+    calls = []
+
+    async def op():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    result = asyncio.run(benchmark.measure(op, runs=10))
+    assert len(calls) == 11  # warm-up plus timed runs
+    assert set(result) == {'median_ms', 'p95_ms'}
+    assert 0 <= result['median_ms'] <= result['p95_ms']
+
+
+def test_save_results_appends_json_lines(tmp_path):
+    output = tmp_path / 'results.jsonl'
+    rows = [(100, 'facet', {'median_ms': 1.5, 'p95_ms': 2.0})]
+    benchmark.save_results(output, 'GET /dashboard/stats', rows)
+    benchmark.save_results(output, 'GET /dashboard/stats', rows)
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0]['results'] == [{'employees': 100, 'variant': 'facet', 'median_ms': 1.5, 'p95_ms': 2.0}]
+
+
+def test_benchmarks_run_end_to_end_at_small_size(mongo):
+    async def scenario():
+        rows = await benchmark.run_dashboard(server.db, [50], runs=2)
+        assert [variant for _, variant, _ in rows] == ['legacy', 'facet', 'materialized']
+        stats = await server.get_dashboard_stats(user=benchmark.BENCH_USER)
+        assert stats.total_karyawan == 50
+
+        rows = await benchmark.run_search(server.db, [50], runs=2)
+        assert [term for _, term, _ in rows] == benchmark.SEARCH_TERMS
+
+    mongo(scenario())
@@ -0,0 +1,84 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def test_round_trip():
+    cursor = server.encode_cursor(['2025-01-22', 'abc'])
+    assert server.decode_cursor(cursor, (str, str)) == ['2025-01-22', 'abc']
+
+
+@pytest.mark.parametrize('values', [
+    [{'$ne': None}, 'abc'],
+    ['2025-01-22', {'$gt': ''}],
+    ['2025-01-22', ['abc']],
+    ['2025-01-22', 5],
+    ['2025-01-22', None],
+    ['2025-01-22', True],
+    ['2025-01-22'],
+    {'tanggal': '2025-01-22', 'id': 'abc'},
+])
+def test_attendance_cursor_rejects_non_string_values(values):
+    with pytest.raises(HTTPException) as exc:
+        server.decode_cursor(raw_cursor(values), (str, str))
+    assert exc.value.status_code == 400
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        server.decode_cursor('not base64 json!', (str, str))
+    assert exc.value.status_code == 400
+
+
+def test_attendance_history_rejects_operator_cursor():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_attendance_history(
+            employee_id=None, start_date=None, end_date=None, include_photos=False,
+            limit=10, after=raw_cursor([{'$ne': None}, {'$ne': None}]),
+            user={'id': 'u', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+        ))
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize('values', [[{'$gt': ''}], [42], [None], ['EMP001', 'extra']])
+def test_employee_cursor_rejects_non_string_nik(values):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_employees(
+            department_id=None, status=None, search=None, limit=10, after=raw_cursor(values),
+            user={'id': 'u', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+        ))
+    assert exc.value.status_code == 400
+
+
+def test_unpaginated_employee_list_signals_truncation(mongo, monkeypatch):
+    monkeypatch.setattr(server, 'EMPLOYEE_LIST_MAX_SIZE', 3)
+
+    async def scenario():
+        await server.db.employees.insert_many([
+            {'id': f'emp-{i}', 'nik': f'EMP{i:03d}', 'nama_lengkap': f'Karyawan {i}', 'email': f'k{i}@haergo.com',
+             'status': 'aktif', 'department_id': 'd', 'position_id': 'p', 'tanggal_bergabung': '2025-01-01',
+             'created_at': '2025-01-01T00:00:00+00:00'}
+            for i in range(5)
+        ])
+        hr = {'id': 'u', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+        response = server.Response()
+        first = await server.get_employees(department_id=None, status=None, search=None, limit=None,
+                                           after=None, response=response, user=hr)
+        assert [e.nik for e in first] == ['EMP000', 'EMP001', 'EMP002']
+        assert server.decode_cursor(response.headers['X-Next-Cursor'], (str,)) == ['EMP002']
+
+        rest = await server.get_employees(department_id=None, status=None, search=None, limit=None,
+                                          after=response.headers['X-Next-Cursor'], user=hr)
+        assert [e.nik for e in rest.items] == ['EMP003', 'EMP004']
+        assert rest.next_cursor is None
+
+    mongo(scenario())
@@ -0,0 +1,41 @@
+import server
+
+
+def employee(i: int, nama: str) -> dict:
+    emp = {'id': f'emp-{i}', 'nik': f'EMP{i:05d}', 'nama_lengkap': nama, 'email': f'user{i}@haergo.com', 'status': 'aktif'}
+    emp['search_terms'] = server.employee_search_terms(emp)
+    return emp
+
+
+def test_best_match_is_found_beyond_first_thousand_candidates(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        # 1500 prefix-only matches ("andi" -> "andika..."), then the exact match last by name
+        await server.db.employees.insert_many([employee(i, f'Andika {i:04d}') for i in range(1500)])
+        await server.db.employees.insert_one(employee(9999, 'Zulkifli Andi'))
+
+        results = await server.search_employees({}, 'andi', limit=5)
+        assert results[0]['id'] == 'emp-9999'
+        assert len(results) == 5
+        assert all('_score' not in r and '_id' not in r for r in results)
+
+        results = await server.search_employees({}, 'EMP00042', limit=3)
+        assert results[0]['id'] == 'emp-42'
+
+    mongo(scenario())
+
+
+def test_startup_backfills_search_terms_in_the_background(mongo):
+    async def scenario():
+        legacy = employee(1, 'Budi Santoso')
+        del legacy['search_terms']
+        await server.db.employees.insert_many([legacy, employee(2, 'Sari Dewi')])
+
+        await server.ensure_employee_search_terms()
+        await server.app.state.search_backfill
+
+        stored = await server.db.employees.find_one({'id': 'emp-1'})
+        assert stored['search_terms'] == server.employee_search_terms(legacy)
+        assert [r['id'] for r in await server.search_employees({}, 'budi', limit=5)] == ['emp-1']
+
+    mongo(scenario())
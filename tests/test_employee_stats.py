@@ -0,0 +1,104 @@
+import server
+
+
+def employee(i: int, status: str = 'aktif', dept: str = 'dept-a', joined: str = '2025-01-10') -> dict:
+    return {'id': f'emp-{i}', 'nik': f'EMP{i:03d}', 'nama_lengkap': f'Karyawan {i}', 'email': f'k{i}@haergo.com',
+            'status': status, 'department_id': dept, 'tanggal_bergabung': joined}
+
+
+async def fresh_counters() -> dict:
+    """Counters straight from a $group over employees, independent of the stats code"""
+    counters = {'total': 0, 'per_status': {}, 'aktif_per_departemen': {}, 'baru_per_bulan': {}}
+    async for row in server.db.employees.aggregate([
+        {'$group': {'_id': {'status': '$status', 'dept': '$department_id', 'bulan': {'$substrCP': ['$tanggal_bergabung', 0, 7]}},
+                    'jumlah': {'$sum': 1}}}
+    ]):
+        key, n = row['_id'], row['jumlah']
+        counters['total'] += n
+        counters['per_status'][key['status']] = counters['per_status'].get(key['status'], 0) + n
+        if key['status'] == 'aktif':
+            counters['aktif_per_departemen'][key['dept']] = counters['aktif_per_departemen'].get(key['dept'], 0) + n
+        counters['baru_per_bulan'][key['bulan']] = counters['baru_per_bulan'].get(key['bulan'], 0) + n
+    return counters
+
+
+async def stored_counters() -> dict:
+    doc = await server.db.stats.find_one({'_id': server.STATS_EMPLOYEES_ID})
+    return {
+        'total': doc['total'],
+        'per_status': {k: v for k, v in doc['per_status'].items() if v},
+        'aktif_per_departemen': {k: v for k, v in doc['aktif_per_departemen'].items() if v},
+        'baru_per_bulan': {k: v for k, v in doc['baru_per_bulan'].items() if v},
+    }
+
+
+async def insert(emp: dict):
+    await server.db.employees.insert_one(dict(emp))
+    await server.apply_employee_stats(None, emp)
+
+
+def test_incremental_counters_match_fresh_group(mongo):
+    async def scenario():
+        await server.rebuild_employee_stats()
+        for i in range(6):
+            await insert(employee(i, dept='dept-a' if i % 2 else 'dept-b'))
+
+        before = await server.db.employees.find_one({'id': 'emp-1'}, {'_id': 0})
+        after = {**before, 'status': 'cuti', 'department_id': 'dept-b'}
+        await server.db.employees.replace_one({'id': 'emp-1'}, after)
+        await server.apply_employee_stats(before, after)
+
+        deleted = await server.db.employees.find_one_and_delete({'id': 'emp-2'}, {'_id': 0})
+        await server.apply_employee_stats(deleted, None)
+
+        assert await stored_counters() == await fresh_counters()
+
+    mongo(scenario())
+
+
+def test_rebuild_does_not_overwrite_increments_applied_meanwhile(mongo, monkeypatch):
+    async def scenario():
+        await insert(employee(0))
+        await server.rebuild_employee_stats()
+
+        compute = server.compute_employee_stats
+        calls = []
+
+        async def compute_with_concurrent_write():
+            result = await compute()
+            if not calls:
+                # An employee write lands after the aggregation read but before the replace
+                await insert(employee(1, joined='2025-02-03'))
+            calls.append(1)
+            return result
+
+        monkeypatch.setattr(server, 'compute_employee_stats', compute_with_concurrent_write)
+        stats_doc = await server.rebuild_employee_stats()
+
+        assert len(calls) == 2  # first attempt lost the epoch race and was retried
+        assert stats_doc['total'] == 2
+        assert await stored_counters() == await fresh_counters()
+
+    mongo(scenario())
+
+
+def test_rebuild_from_missing_document_sees_concurrent_writes(mongo, monkeypatch):
+    async def scenario():
+        await server.db.employees.insert_one(employee(0))
+        compute = server.compute_employee_stats
+        calls = []
+
+        async def compute_with_concurrent_write():
+            result = await compute()
+            if not calls:
+                await insert(employee(1))
+            calls.append(1)
+            return result
+
+        monkeypatch.setattr(server, 'compute_employee_stats', compute_with_concurrent_write)
+        await server.rebuild_employee_stats()
+
+        assert len(calls) == 2
+        assert await stored_counters() == await fresh_counters()
+
+    mongo(scenario())
@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import server
+
+DIM = server.FACE_DESCRIPTOR_SIZE
+FACE_USER = {'id': 'user-1', 'email': 'budi@haergo.com', 'role': 'employee', 'employee_id': 'emp-1'}
+
+
+def face(seed: int) -> np.ndarray:
+    """A random unit-length descriptor; distinct seeds are far apart (~1.4)"""
+    v = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def near(descriptor: np.ndarray, offset: float = 0.05) -> np.ndarray:
+    nudge = np.zeros(DIM, dtype=np.float32)
+    nudge[0] = offset
+    return descriptor + nudge
+
+
+def new_index() -> server.FaceIndex:
+    return server.FaceIndex(DIM, sync_seconds=60)
+
+
+def test_identify_uses_the_best_template_of_each_employee():
+    index = new_index()
+    index.upsert('emp-1', np.stack([face(1), face(2), face(3)]))
+    index.upsert('emp-2', face(4))
+
+    matches = index.identify(near(face(3)), k=2)
+    assert [m[0] for m in matches] == ['emp-1', 'emp-2']
+    assert abs(matches[0][1] - 0.05) < 1e-4
+    assert index.stats()['templates'] == 4
+
+
+def test_fewer_templates_release_rows_that_never_rank():
+    index = new_index()
+    index.upsert('emp-1', np.stack([face(1), face(2), face(3)]))
+    index.upsert('emp-1', face(1))
+
+    assert index.stats()['employees'] == 1
+    assert index.stats()['templates'] == 1
+    assert len(index.free_rows) == 2
+    # The released rows still hold face(2)/face(3) data but are excluded
+    matches = index.identify(face(2), k=5)
+    assert [m[0] for m in matches] == ['emp-1']
+    assert matches[0][1] > 1.0
+
+    # Released rows are reused before the matrix grows
+    index.upsert('emp-2', np.stack([face(5), face(6)]))
+    assert index.size == 3
+    assert index.free_rows == []
+
+
+def test_stored_templates_reads_both_layouts():
+    templates = np.stack([face(1), face(2)])
+    legacy = {'face_descriptor': server.pack_descriptor(templates)}
+    current = {'face_templates': [t.tobytes() for t in templates]}
+    old_array = {'face_descriptor': face(1).astype(float).tolist()}
+
+    assert np.array_equal(server.stored_templates(legacy), templates)
+    assert np.array_equal(server.stored_templates(current), templates)
+    assert server.stored_templates(old_array).shape == (1, DIM)
+
+
+def test_concurrent_registrations_keep_every_template_up_to_the_cap(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        count = server.FACE_MAX_TEMPLATES + 3
+        await asyncio.gather(*(
+            server.register_face(server.FaceDataCreate(face_descriptor=face(i).tolist()), user=FACE_USER)
+            for i in range(count)
+        ))
+        stored = await server.db.face_data.find_one({'employee_id': 'emp-1'})
+        templates = server.stored_templates(stored)
+        assert len(templates) == server.FACE_MAX_TEMPLATES
+        registered = {face(i).tobytes() for i in range(count)}
+        assert all(t.tobytes() in registered for t in templates)
+        assert len({t.tobytes() for t in templates}) == server.FACE_MAX_TEMPLATES
+
+    mongo(scenario())
+
+
+def test_registration_appends_to_a_legacy_record(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.face_data.insert_one({
+            'id': 'f1', 'employee_id': 'emp-1',
+            'face_descriptor': server.pack_descriptor(np.stack([face(1), face(2)])),
+            'updated_at': '2025-01-01T00:00:00+00:00'
+        })
+        result = await server.register_face(server.FaceDataCreate(face_descriptor=face(3).tolist()), user=FACE_USER)
+        assert result['jumlah_template'] == 3
+
+        stored = await server.db.face_data.find_one({'employee_id': 'emp-1'})
+        assert 'face_descriptor' not in stored
+        assert np.array_equal(server.stored_templates(stored), np.stack([face(1), face(2), face(3)]))
+
+    mongo(scenario())
+
+
+def test_upsert_replaces_an_employees_templates():
+    index = new_index()
+    index.upsert('emp-1', face(1))
+    index.upsert('emp-1', face(2))
+
+    assert index.stats()['templates'] == 1
+    assert np.array_equal(index.templates('emp-1'), face(2)[None, :])
+    assert index.identify(face(2), k=1)[0][1] < 1e-3
+
+
+def test_remove_frees_rows_for_reuse():
+    index = new_index()
+    index.upsert('emp-1', np.stack([face(1), face(2)]))
+    index.upsert('emp-2', face(3))
+    index.remove('emp-1')
+    index.remove('emp-unknown')
+
+    assert index.templates('emp-1') is None
+    assert sorted(index.free_rows) == [0, 1]
+    assert [m[0] for m in index.identify(face(1), k=5)] == ['emp-2']
+
+    index.upsert('emp-4', face(4))
+    assert index.size == 3
+    assert index.rows['emp-4'][0] in (0, 1)
+    assert index.stats()['employees'] == 2
+    assert index.stats()['templates'] == 2
+
+
+def test_identify_distance_against_threshold():
+    index = new_index()
+    index.upsert('emp-1', face(1))
+
+    (employee_id, distance), = index.identify(near(face(1), 0.3), k=1)
+    assert employee_id == 'emp-1'
+    assert abs(distance - 0.3) < 1e-4
+    assert distance <= server.FACE_MATCH_THRESHOLD
+
+    (_, distance), = index.identify(face(2), k=1)
+    assert distance > server.FACE_MATCH_THRESHOLD
+
+    assert new_index().identify(face(1), k=3) == []
+
+
+def synced_index(monkeypatch) -> server.FaceIndex:
+    """Module-level face index that will not try to sync from the database"""
+    index = new_index()
+    index.synced_until = '2025-01-01T00:00:00+00:00'
+    index.checked_at = time.monotonic()
+    monkeypatch.setattr(server, 'face_index', index)
+    return index
+
+
+def test_verify_face_accepts_a_close_descriptor_and_rejects_a_far_one(monkeypatch):
+    synced_index(monkeypatch).upsert('emp-1', np.stack([face(1), face(2)]))
+
+    distance = asyncio.run(server.verify_face('emp-1', near(face(2), 0.2).tolist()))
+    assert abs(distance - 0.2) < 1e-4
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.verify_face('emp-1', face(3).tolist()))
+    assert exc.value.detail == "Wajah tidak cocok dengan data terdaftar"
+
+
+@pytest.mark.parametrize('bad', [float('nan'), float('inf'), float('-inf')])
+def test_non_finite_descriptors_are_rejected_everywhere(monkeypatch, bad):
+    synced_index(monkeypatch).upsert('emp-1', face(1))
+    descriptor = face(1).tolist()
+    descriptor[7] = bad
+    all_nan = [float('nan')] * DIM
+
+    for values in (descriptor, all_nan):
+        assert not server.valid_descriptor(values)
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(server.verify_face('emp-1', values))
+        assert exc.value.status_code == 400
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(server.register_face(server.FaceDataCreate(face_descriptor=values), user=FACE_USER))
+        assert exc.value.status_code == 400
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(server.identify_face(server.FaceIdentifyRequest(face_descriptor=values), user=FACE_USER))
+        assert exc.value.status_code == 400
+
+    assert not server.valid_descriptor(face(1).tolist()[:-1])
+    assert server.valid_descriptor(face(1).tolist())
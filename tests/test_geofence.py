@@ -0,0 +1,28 @@
+import numpy as np
+
+import server
+
+
+def test_haversine_matrix_matches_known_distances():
+    # One degree of latitude is ~111.2 km; same point is 0
+    lat = np.radians([0.0, -6.161777])
+    lon = np.radians([0.0, 106.875199])
+    office_lat = np.radians([1.0, -6.161777])
+    office_lon = np.radians([0.0, 106.875199])
+    distances = server.haversine_matrix(lat, lon, office_lat, office_lon)
+
+    assert distances.shape == (2, 2)
+    assert abs(distances[0, 0] - 111195) < 10
+    assert distances[1, 1] < 1e-6
+
+
+def test_check_geofence_chunk_flags_points_outside_every_radius():
+    office_lat = np.radians([-6.161777, -6.2])
+    office_lon = np.radians([106.875199, 106.8])
+    radius = np.array([100.0, 100.0])
+    coords = np.array([[-6.161777, 106.875199], [-6.2005, 106.8], [-6.18, 106.85]])
+
+    within, nearest, distance = server.check_geofence_chunk(coords, office_lat, office_lon, radius)
+    assert within.tolist() == [True, True, False]
+    assert nearest.tolist()[:2] == [0, 1]
+    assert distance[2] > 100
@@ -0,0 +1,132 @@
+import asyncio
+import base64
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import server
+
+EMPLOYEE_USER = {'id': 'user-1', 'email': 'budi@haergo.com', 'role': 'employee', 'employee_id': 'emp-1'}
+OTHER_USER = {'id': 'user-2', 'email': 'sari@haergo.com', 'role': 'employee', 'employee_id': 'emp-2'}
+HR_USER = {'id': 'user-3', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+
+
+def png_bytes() -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (32, 24), (200, 120, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def clock(tipe: str, foto: str) -> server.AttendanceCreate:
+    return server.AttendanceCreate(tipe=tipe, mode='wfh', latitude=-6.2, longitude=106.8, foto_url=foto)
+
+
+def test_decode_photo_reference_hashes_inline_photo_without_storing():
+    content = png_bytes()
+    reference, decoded = server.decode_photo_reference('data:image/png;base64,' + base64.b64encode(content).decode())
+    assert decoded == content
+    assert reference == server.photo_url(hashlib.sha256(content).hexdigest())
+
+    assert server.decode_photo_reference('https://example.com/a.jpg') == ('https://example.com/a.jpg', None)
+    with pytest.raises(HTTPException) as exc:
+        server.decode_photo_reference('data:image/png;base64,' + base64.b64encode(b'not an image').decode())
+    assert exc.value.status_code == 400
+
+
+def test_concurrent_identical_uploads_store_one_file(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        content = png_bytes()
+        ids = await asyncio.gather(*(server.store_photo(content) for _ in range(5)))
+        assert len(set(ids)) == 1
+        assert await server.db['photos.files'].count_documents({'filename': ids[0]}) == 1
+        file_doc = await server.db['photos.files'].find_one({'filename': ids[0]})
+        assert await server.db['photos.chunks'].count_documents({}) == \
+            await server.db['photos.chunks'].count_documents({'files_id': file_doc['_id']})
+
+    mongo(scenario())
+
+
+def test_rejected_clock_in_leaves_no_photo(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.employees.insert_one({'id': 'emp-1', 'nik': 'EMP001', 'nama_lengkap': 'Budi', 'status': 'aktif'})
+        foto = 'data:image/png;base64,' + base64.b64encode(png_bytes()).decode()
+
+        with pytest.raises(HTTPException):
+            await server.clock_attendance(clock('clock_out', foto), user=EMPLOYEE_USER)
+        assert await server.db['photos.files'].count_documents({}) == 0
+
+        await server.clock_attendance(clock('clock_in', foto), user=EMPLOYEE_USER)
+        assert await server.db['photos.files'].count_documents({}) == 1
+
+    mongo(scenario())
+
+
+def test_photo_access_is_limited_to_owner_and_hr(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.employees.insert_one({'id': 'emp-1', 'nik': 'EMP001', 'nama_lengkap': 'Budi', 'status': 'aktif'})
+        content = png_bytes()
+        foto = 'data:image/png;base64,' + base64.b64encode(content).decode()
+        await server.clock_attendance(clock('clock_in', foto), user=EMPLOYEE_USER)
+        photo_id = hashlib.sha256(content).hexdigest()
+
+        await server.check_photo_access(photo_id, EMPLOYEE_USER)
+        await server.check_photo_access(photo_id, HR_USER)
+        with pytest.raises(HTTPException) as exc:
+            await server.check_photo_access(photo_id, OTHER_USER)
+        assert exc.value.status_code == 403
+
+    mongo(scenario())
+
+
+def test_concurrent_thumbnail_generation_stores_one_file(mongo, monkeypatch):
+    async def scenario():
+        await server.ensure_indexes()
+        photo_id = await server.store_photo(png_bytes())
+        render = server.render_thumbnail
+
+        async def render_after_other_request(content):
+            thumb = await render(content)
+            # Another request stores the same thumbnail between our lookup and upload
+            await server.photo_bucket().upload_from_stream(f'{photo_id}_thumb', thumb)
+            return thumb
+
+        monkeypatch.setattr(server, 'render_thumbnail', render_after_other_request)
+        try:
+            thumb = await server.ensure_thumbnail(photo_id)
+        finally:
+            server.shutdown_thumbnail_executor()
+
+        assert thumb
+        assert await server.db['photos.files'].count_documents({'filename': f'{photo_id}_thumb'}) == 1
+        file_ids = [d['_id'] for d in await server.db['photos.files'].find({}, {'_id': 1}).to_list(None)]
+        assert await server.db['photos.chunks'].count_documents({'files_id': {'$nin': file_ids}}) == 0
+
+    mongo(scenario())
+
+
+def test_photo_store_failure_keeps_the_clock_in(mongo, monkeypatch):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.employees.insert_one({'id': 'emp-1', 'nik': 'EMP001', 'nama_lengkap': 'Budi', 'status': 'aktif'})
+        foto = 'data:image/png;base64,' + base64.b64encode(png_bytes()).decode()
+
+        async def failing_store(content):
+            raise OSError('GridFS unavailable')
+
+        monkeypatch.setattr(server, 'store_photo', failing_store)
+        response = await server.clock_attendance(clock('clock_in', foto), user=EMPLOYEE_USER)
+
+        assert response.clock_in is not None
+        assert response.clock_in_foto is None
+        stored = await server.db.attendance.find_one({'employee_id': 'emp-1'})
+        assert stored['clock_in_foto'] is None and stored['clock_in_thumb'] is None
+        monthly = await server.db.attendance_monthly.find_one({'employee_id': 'emp-1'})
+        assert sum(monthly['per_status'].values()) == 1
+
+    mongo(scenario())
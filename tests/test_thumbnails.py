@@ -0,0 +1,47 @@
+import asyncio
+import io
+
+from PIL import Image
+
+import server
+
+
+def jpeg(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(out, format='JPEG')
+    return out.getvalue()
+
+
+def render(content: bytes):
+    async def run():
+        try:
+            return await server.render_thumbnail(content, 160)
+        finally:
+            server.shutdown_thumbnail_executor()
+    return asyncio.run(run())
+
+
+def test_thumbnail_pool_uses_spawn():
+    try:
+        assert server.thumbnail_executor()._mp_context.get_start_method() == 'spawn'
+    finally:
+        server.shutdown_thumbnail_executor()
+
+
+def test_render_thumbnail_shrinks_to_longest_side():
+    thumb = render(jpeg(800, 400))
+    with Image.open(io.BytesIO(thumb)) as image:
+        assert image.format == 'JPEG'
+        assert image.size == (160, 80)
+
+
+def test_render_thumbnail_returns_none_for_undecodable_content():
+    assert render(b'not an image') is None
+    assert render(jpeg(800, 400)[:200]) is None
+
+
+def test_render_thumbnail_returns_none_for_decompression_bomb():
+    # 14000 x 14000 is over twice Image.MAX_IMAGE_PIXELS, which Pillow refuses to open
+    out = io.BytesIO()
+    Image.new('1', (14000, 14000)).save(out, format='PNG')
+    assert render(out.getvalue()) is None
@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+HR_USER = {'id': 'user-3', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+
+
+def test_update_employee_to_a_taken_email_is_rejected(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.employees.insert_many([
+            {'id': 'emp-1', 'nik': 'EMP001', 'nama_lengkap': 'Budi', 'email': 'budi@haergo.com', 'status': 'aktif'},
+            {'id': 'emp-2', 'nik': 'EMP002', 'nama_lengkap': 'Sari', 'email': 'sari@haergo.com', 'status': 'aktif'},
+        ])
+
+        with pytest.raises(HTTPException) as exc:
+            await server.update_employee('emp-2', server.EmployeeUpdate(email='budi@haergo.com'), user=HR_USER)
+        assert exc.value.status_code == 400
+        assert exc.value.detail == "NIK atau Email sudah terdaftar"
+        assert (await server.db.employees.find_one({'id': 'emp-2'}))['email'] == 'sari@haergo.com'
+
+    mongo(scenario())
+
+
+def test_update_department_to_a_taken_kode_is_rejected(mongo):
+    async def scenario():
+        await server.ensure_indexes()
+        await server.db.departments.insert_many([
+            {'id': 'dept-a', 'nama': 'IT', 'deskripsi': None, 'kode': 'IT'},
+            {'id': 'dept-b', 'nama': 'HR', 'deskripsi': None, 'kode': 'HR'},
+        ])
+
+        with pytest.raises(HTTPException) as exc:
+            await server.update_department('dept-b', server.DepartmentCreate(nama='HR', kode='IT'), user=HR_USER)
+        assert exc.value.status_code == 400
+        assert exc.value.detail == "Kode departemen sudah ada"
+
+    mongo(scenario())
@@ -0,0 +1,71 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the cache"""
+    now = [1000.0]
+    monkeypatch.setattr(server.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = server.TTLCache(max_size=10, ttl_seconds=30)
+    cache.set('u1', {'id': 'u1'})
+
+    clock[0] += 30
+    assert cache.get('u1') == {'id': 'u1'}
+    clock[0] += 0.5
+    assert cache.get('u1') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted_at_max_size(clock):
+    cache = server.TTLCache(max_size=2, ttl_seconds=30)
+    cache.set('u1', 1)
+    cache.set('u2', 2)
+    assert cache.get('u1') == 1  # u2 is now the least recently used
+    cache.set('u3', 3)
+
+    assert cache.get('u2') is None
+    assert cache.get('u1') == 1
+    assert cache.get('u3') == 3
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 2
+
+
+def test_invalidate_and_clear_drop_entries(clock):
+    cache = server.TTLCache(max_size=10, ttl_seconds=30)
+    cache.set('u1', 1)
+    cache.set('u2', 2)
+
+    cache.invalidate('u1')
+    cache.invalidate('unknown')
+    assert cache.get('u1') is None
+    assert cache.get('u2') == 2
+
+    cache.clear()
+    assert cache.get('u2') is None
+
+
+def test_hit_and_miss_counters(clock):
+    cache = server.TTLCache(max_size=10, ttl_seconds=30)
+    assert cache.get('u1') is None
+    cache.set('u1', 1)
+    cache.get('u1')
+    cache.get('u1')
+    clock[0] += 31
+    cache.get('u1')  # expired entries count as misses
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 2)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_disabled_cache_stores_nothing(clock):
+    for cache in (server.TTLCache(max_size=0, ttl_seconds=30), server.TTLCache(max_size=10, ttl_seconds=0)):
+        cache.set('u1', 1)
+        assert cache.get('u1') is None
+        assert cache.stats()['hit_rate'] == 0.0
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+GLOBAL_HOURS = {'start': '08:00', 'end': '17:00', 'late_tolerance_minutes': 15}
+NIGHT_SHIFT = {'id': 'shift-night', 'nama': 'Malam', 'jam_masuk': '22:00', 'jam_keluar': '06:00'}
+MIDNIGHT_SHIFT = {'id': 'shift-midnight', 'nama': 'Tengah Malam', 'jam_masuk': '00:00', 'jam_keluar': '08:00'}
+MORNING_SHIFT = {'id': 'shift-pagi', 'nama': 'Pagi', 'jam_masuk': '06:00', 'jam_keluar': '14:00'}
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+def cache_with(schedules: dict) -> server.AttendanceSettingsCache:
+    cache = server.AttendanceSettingsCache(check_seconds=60)
+    cache.work_hours = dict(GLOBAL_HOURS)
+    cache.schedules = schedules
+    return cache
+
+
+def test_global_hours_compare_on_the_clock_in_day():
+    assert not server.is_late(at(10, 8, 10), GLOBAL_HOURS)
+    assert server.is_late(at(10, 8, 16), GLOBAL_HOURS)
+    # No overnight window for global hours: a late-evening clock-in is late
+    assert server.is_late(at(10, 23, 50), GLOBAL_HOURS)
+    assert not server.is_late(at(10, 0, 30), GLOBAL_HOURS)
+
+
+def test_overnight_shift_clock_in_after_midnight_is_late():
+    hours = cache_with({'emp-1': [('2025-01-01', None, NIGHT_SHIFT)]}).work_hours_for('emp-1', '2025-01-11')
+    assert hours['shift_id'] == 'shift-night'
+    assert not server.is_late(at(10, 22, 10), hours)
+    assert server.is_late(at(11, 0, 30), hours)
+
+
+def test_early_arrival_before_midnight_shift_is_not_late():
+    hours = cache_with({'emp-1': [('2025-01-01', None, MIDNIGHT_SHIFT)]}).work_hours_for('emp-1', '2025-01-10')
+    assert not server.is_late(at(10, 23, 50), hours)
+    assert not server.is_late(at(11, 0, 10), hours)
+    assert server.is_late(at(11, 0, 20), hours)
+
+
+def test_no_shift_falls_back_to_global_hours():
+    cache = cache_with({'emp-1': [('2025-02-01', None, NIGHT_SHIFT)]})
+    assert cache.shift_for('emp-1', '2025-01-10') is None
+    assert cache.work_hours_for('emp-2', '2025-01-10') == GLOBAL_HOURS
+    assert server.is_late(at(10, 23, 50), cache.work_hours_for('emp-1', '2025-01-10'))
+
+
+def test_overlapping_assignments_resolve_to_the_newest(mongo):
+    async def scenario():
+        await server.db.shifts.insert_many([dict(NIGHT_SHIFT), dict(MORNING_SHIFT)])
+        # Inserted newest first so natural order would pick the wrong one
+        await server.db.shift_assignments.insert_many([
+            {'id': 'b', 'employee_id': 'emp-1', 'shift_id': 'shift-pagi', 'tanggal_mulai': '2025-01-05', 'tanggal_selesai': None},
+            {'id': 'a', 'employee_id': 'emp-1', 'shift_id': 'shift-night', 'tanggal_mulai': '2025-01-01', 'tanggal_selesai': None},
+        ])
+        cache = server.AttendanceSettingsCache(check_seconds=60)
+        await cache.reload_schedules(1)
+
+        assert cache.shift_for('emp-1', '2025-01-03')['id'] == 'shift-night'
+        assert cache.shift_for('emp-1', '2025-01-10')['id'] == 'shift-pagi'
+
+    mongo(scenario())
+
+
+@pytest.mark.parametrize('bad', ['08.00', '8', '25:00', '08:60', '', 'pagi'])
+def test_shift_writes_reject_malformed_times(bad):
+    hr = {'id': 'u', 'email': 'hr@haergo.com', 'role': 'hr', 'employee_id': None}
+    for data in (
+        server.ShiftCreate(nama='Pagi', jam_masuk=bad, jam_keluar='14:00'),
+        server.ShiftCreate(nama='Pagi', jam_masuk='06:00', jam_keluar=bad),
+    ):
+        # Validation runs before any database access
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(server.create_shift(data, user=hr))
+        assert exc.value.detail == "Format jam tidak valid (HH:MM)"
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(server.update_shift('shift-1', data, user=hr))
+        assert exc.value.detail == "Format jam tidak valid (HH:MM)"
+
+
+def test_valid_shift_times_pass_validation():
+    server.validate_clock_times('06:00', '22:30', '00:00', '23:59')